@@ -1,7 +1,7 @@
 import requests
 
 base_url = "http://127.0.0.1:8000/api/"
-url = f"{base_url}courses/"
+url = f"{base_url}courses/?pagination=cursor"
 available_courses = []
 
 while url is not None:
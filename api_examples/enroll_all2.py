@@ -4,8 +4,9 @@ username = ''
 password = ''
 
 base_url = "http://127.0.0.1:8000/api/"
-url = f"{base_url}courses/"
+url = f"{base_url}courses/?pagination=cursor"
 available_courses = []
+course_ids = []
 
 while url is not None:
     print(f"Loading courses from {url}")
@@ -14,13 +15,16 @@ while url is not None:
     url = response['next']
     courses = response['results']
     available_courses += [course['title'] for course in courses]
+    course_ids += [course['id'] for course in courses]
 print(f'Available courses: {", ".join(available_courses)}')
 
-for course in courses:
-    course_id = course['id']
-    course_title = course['title']
-    r = requests.post(f'{base_url}courses/{course_id}/enroll/', auth=(username, password))
+# enroll in all courses with a single request
+r = requests.post(
+    f'{base_url}courses/enroll/', json={'courses': course_ids}, auth=(username, password)
+)
 
-    if r.status_code == 200:
-        # successful request
-        print(f'Successfully enrolled in {course_title}')
+if r.status_code == 200:
+    # successful request
+    for result in r.json()['results']:
+        if 'error' not in result:
+            print(f'Successfully enrolled in course {result["id"]}')
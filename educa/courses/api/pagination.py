@@ -1,7 +1,154 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from rest_framework import exceptions
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class StandardPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 50
+
+
+# keyset pagination: pages start after the ordering values of the last
+# row of the previous page, so there is no COUNT(*) and no OFFSET scan
+class KeysetPagination(BasePagination):
+    page_size = StandardPagination.page_size
+    page_size_query_param = StandardPagination.page_size_query_param
+    max_page_size = StandardPagination.max_page_size
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, ordering):
+        # e.g. ("-created", "-id"); the last field must be unique
+        self.ordering = ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        cursor = self.decode_cursor(request)
+        backwards = cursor is not None and cursor["back"]
+        ordering = (
+            [self.invert(f) for f in self.ordering] if backwards else self.ordering
+        )
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(ordering, cursor["values"]))
+
+        page_size = self.get_page_size(request)
+        rows = list(queryset[: page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+            self.has_next, self.has_previous = bool(rows), has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = rows
+        return rows
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    def after(self, ordering, values):
+        # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y)
+        condition = None
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            term = Q(**equal, **{f"{name}__{lookup}": value})
+            condition = term if condition is None else condition | term
+            equal[name] = value
+        return condition
+
+    def position(self, obj):
+        return [
+            self.model._meta.get_field(field.lstrip("-")).value_to_string(obj)
+            for field in self.ordering
+        ]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values = [
+                self.model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, cursor["values"], strict=True)
+            ]
+            if None in values:
+                raise ValueError("Empty ordering value")
+            return {"values": values, "back": bool(cursor.get("back"))}
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise exceptions.ValidationError(
+                {self.cursor_query_param: self.invalid_cursor_message}
+            )
+
+    def encode_cursor(self, obj, back):
+        cursor = json.dumps({"values": self.position(obj), "back": back})
+        encoded = base64.urlsafe_b64encode(cursor.encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encoded
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], back=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.encode_cursor(self.page[0], back=True)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+
+# page number pagination by default; clients opt in to keyset pagination
+# per request with ?pagination=cursor, then follow the cursor links
+class CatalogPagination(StandardPagination):
+    keyset = None
+
+    def use_keyset(self, request):
+        return (
+            KeysetPagination.cursor_query_param in request.query_params
+            or request.query_params.get("pagination") == "cursor"
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.keyset = KeysetPagination(view.cursor_ordering)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,24 +1,42 @@
+import json
+
+from django.contrib.auth.models import User
 from rest_framework import serializers
-from courses.models import Content, Course, Module, Subject
+from rest_framework.exceptions import PermissionDenied
+from courses.models import (
+    ChunkedUpload,
+    Content,
+    Course,
+    Module,
+    SearchEntry,
+    Subject,
+)
+from courses.cache import prime_fragments
+from courses.catalog import get_popular
+
+from django.db.models import Manager
+
 
-# import to add aggregation function
-from django.db.models import Count
+# loads the popular courses of a page of subjects at once
+class SubjectListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        subjects = list(data.all() if isinstance(data, Manager) else data)
+        self.context["popular_courses"] = get_popular([s.id for s in subjects])
+        return super().to_representation(subjects)
 
 
 # serialized subjects
 class SubjectSerializer(serializers.ModelSerializer):
-    total_courses = serializers.IntegerField()
     popular_courses = serializers.SerializerMethodField()
 
     def get_popular_courses(self, obj):
-        courses = obj.courses.annotate(total_students=Count("students")).order_by(
-            "total_students"
-        )[:3]
-        return [f"{c.title} ({c.total_students})" for c in courses]
+        popular = self.context.get("popular_courses") or get_popular([obj.id])
+        return [f"{title} ({total})" for title, total in popular[obj.id]]
 
     class Meta:
         model = Subject
         fields = ["id", "title", "slug", "total_courses", "popular_courses"]
+        list_serializer_class = SubjectListSerializer
 
 
 class ModuleSerializer(serializers.ModelSerializer):
@@ -51,14 +69,23 @@ class ItemRelatedField(serializers.RelatedField):
     def to_representation(self, value):
         return value.render()
 
+
+# loads the rendered items of a list of contents at once
+class ContentListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        contents = list(data.all() if isinstance(data, Manager) else data)
+        prime_fragments([content.item for content in contents])
+        return super().to_representation(contents)
+
+
 # serialized contents
 class ContentSerializer(serializers.ModelSerializer):
     item = ItemRelatedField(read_only=True)
 
     class Meta:
         model = Content
-        fields = ['order', 'item']
-
+        fields = ["order", "item"]
+        list_serializer_class = ContentListSerializer
 
 
 class ModuleWithContentsSerializer(serializers.ModelSerializer):
@@ -66,11 +93,146 @@ class ModuleWithContentsSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Module
-        fields = ['order', 'title', 'description', 'contents']
+        fields = ["order", "title", "description", "contents"]
 
 
 class CourseWithContentsSerializer(serializers.ModelSerializer):
     modules = ModuleWithContentsSerializer(many=True)
+
     class Meta:
         model = Course
-        fields = [ 'id', 'subject', 'title', 'slug', 'overview', 'created', 'owner', 'modules']
+        fields = [
+            "id",
+            "subject",
+            "title",
+            "slug",
+            "overview",
+            "created",
+            "owner",
+            "modules",
+        ]
+
+
+# lightweight read path for the contents action: plain dicts instead of
+# nested DRF serializers; modules, contents and items must be prefetched
+class CourseContentsSerializer:
+    created_field = serializers.DateTimeField()
+
+    def __init__(self, course):
+        self.course = course
+        self.modules = list(course.modules.all())
+        prime_fragments(
+            [
+                content.item
+                for module in self.modules
+                for content in module.contents.all()
+            ]
+        )
+
+    def course_data(self):
+        course = self.course
+        return {
+            "id": course.id,
+            "subject": course.subject_id,
+            "title": course.title,
+            "slug": course.slug,
+            "overview": course.overview,
+            "created": self.created_field.to_representation(course.created),
+            "owner": course.owner_id,
+        }
+
+    def module_data(self, module):
+        return {
+            "order": module.order,
+            "title": module.title,
+            "description": module.description,
+            "contents": [
+                {"order": content.order, "item": self.item_data(content.item)}
+                for content in module.contents.all()
+            ],
+        }
+
+    def item_data(self, item):
+        # the item of a content can be deleted on its own
+        return item.render() if item is not None else None
+
+    @property
+    def data(self):
+        data = self.course_data()
+        data["modules"] = [self.module_data(module) for module in self.modules]
+        return data
+
+    def stream(self):
+        # the same JSON document, produced one module at a time
+        yield json.dumps(self.course_data())[:-1] + ', "modules": ['
+        for index, module in enumerate(self.modules):
+            yield (", " if index else "") + json.dumps(self.module_data(module))
+        yield "]}"
+
+
+# enrollment of users, by default the requesting one, in many courses
+class BulkEnrollSerializer(serializers.Serializer):
+    courses = serializers.ListField(child=serializers.IntegerField())
+    users = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate_courses(self, course_ids):
+        return list(dict.fromkeys(course_ids))
+
+    def validate_users(self, user_ids):
+        # only admins can enroll other users, checked before telling
+        # which users exist
+        if not self.context["request"].user.is_staff:
+            raise PermissionDenied()
+        user_ids = list(dict.fromkeys(user_ids))
+        found = set(User.objects.filter(id__in=user_ids).values_list("id", flat=True))
+        unknown = [pk for pk in user_ids if pk not in found]
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown users: {', '.join(map(str, unknown))}."
+            )
+        return user_ids
+
+
+# chunked uploads of File and Image contents
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    model = serializers.ChoiceField(
+        source="model_name", choices=ChunkedUpload.MODEL_CHOICES
+    )
+
+    class Meta:
+        model = ChunkedUpload
+        fields = [
+            "id",
+            "module",
+            "model",
+            "title",
+            "filename",
+            "size",
+            "offset",
+            "content",
+        ]
+        read_only_fields = ["id", "offset", "content"]
+
+    def validate_module(self, module):
+        if module.course.owner_id != self.context["request"].user.id:
+            raise serializers.ValidationError("Not one of your modules.")
+        return module
+
+
+# ranked results of the catalog search
+class SearchEntrySerializer(serializers.ModelSerializer):
+    course_title = serializers.CharField(source="course.title")
+    module_title = serializers.CharField(source="module.title", default=None)
+    url = serializers.CharField(source="get_absolute_url")
+
+    class Meta:
+        model = SearchEntry
+        fields = [
+            "kind",
+            "title",
+            "course",
+            "course_title",
+            "module",
+            "module_title",
+            "url",
+        ]
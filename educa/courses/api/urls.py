@@ -10,10 +10,12 @@ app_name = "courses"
 router = routers.DefaultRouter()
 router.register('courses', views.CourseViewSet)
 router.register('subjects', views.SubjectViewSet)
+router.register('uploads', views.UploadViewSet, basename='upload')
 
 urlpatterns = [
     #path("subjects/", views.SubjectListView.as_view(), name="subject_list"),
     #path("subjects/<pk>/", views.SubjectDetailView.as_view(), name="subject_detail"),
     path("", include(router.urls)), # router implemented
+    path("search/", views.SearchView.as_view(), name="search"),
     #path('courses/<pk>/enroll/', views.CourseEnrollView.as_view(), name='course_enroll'),
 ]
@@ -1,18 +1,26 @@
 from rest_framework import generics
 from courses.api.serializers import SubjectSerializer, CourseSerializer
-from courses.models import Subject, Course
+from courses.models import Subject, Course, Content
 
-# import to add django aggregate function
-from django.db.models import Count
+# import to prefetch course contents
+from django.db.models import Prefetch
+
+# imports for conditional requests
+import hashlib
+from datetime import datetime, timezone
+from courses.cache import get_courses_version
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 
 # import to add pagination
-from courses.api.pagination import StandardPagination
+from courses.api.pagination import CatalogPagination
 
 # import for viewset
 from rest_framework import viewsets
 
 # import for building custom API views
-from django.shortcuts import get_object_or_404
+# DRF's version answers 404 to a malformed pk as well
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
@@ -20,6 +28,12 @@ from rest_framework.views import APIView
 from rest_framework.authentication import BasicAuthentication
 from rest_framework.permissions import IsAuthenticated
 
+# imports for bulk enrollment
+from rest_framework import status
+from rest_framework.exceptions import PermissionDenied
+from courses.api.serializers import BulkEnrollSerializer
+from courses.enrollment import enroll_users
+
 # import to add addtional actions to viewset
 from rest_framework.decorators import action
 
@@ -27,6 +41,30 @@ from rest_framework.decorators import action
 from courses.api.permissions import IsEnrolled
 from courses.api.serializers import CourseWithContentsSerializer
 
+# imports for the lightweight course contents read path
+from django.http import StreamingHttpResponse
+from courses.api.serializers import CourseContentsSerializer
+
+# imports for course export and import
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from courses import transfer
+
+# imports for chunked uploads
+from rest_framework import mixins
+from courses.api.serializers import ChunkedUploadSerializer
+from courses.models import ChunkedUpload
+from courses.uploads import (
+    OffsetMismatch, UploadError, UPLOAD_CHUNK_SIZE, complete_upload, start_upload,
+    write_chunk,
+)
+
+# imports for the catalog search
+from rest_framework.permissions import AllowAny
+from courses.api.pagination import StandardPagination
+from courses.api.serializers import SearchEntrySerializer
+from courses.search import SearchResults
+
 
 """
 class SubjectListView(generics.ListAPIView):
@@ -38,20 +76,69 @@ class SubjectListView(generics.ListAPIView):
 
 # implementing the subject viewset; commented out SubjectListView
 class SubjectViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Subject.objects.annotate(total_courses=Count('courses'))
+    queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
-    pagination_class = StandardPagination
+    pagination_class = CatalogPagination
+    cursor_ordering = ('title', 'id')
 
 class SubjectDetailView(generics.RetrieveAPIView):
-    # queryset = Subject.objects.all()
-    queryset = Subject.objects.annotate(total_courses=Count("courses"))
+    queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
 
+# conditional GET support: ETag / Last-Modified from the course versions,
+# answered with 304 before anything gets serialized
+class ConditionalMixin:
+    def conditional(self, request, etag, last_modified, respond):
+        etag = quote_etag(f'{etag}-{request.accepted_renderer.format}')
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = respond()
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+
 # implementing course viewset
-class CourseViewSet(viewsets.ReadOnlyModelViewSet):
+class CourseViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Course.objects.prefetch_related('modules')
     serializer_class = CourseSerializer
-    pagination_class = StandardPagination
+    pagination_class = CatalogPagination
+    cursor_ordering = ('-created', '-id')
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action == 'contents':
+            # load every content item of the course in a fixed number of queries
+            qs = qs.prefetch_related(
+                Prefetch('modules__contents', queryset=Content.objects.with_items())
+            )
+        return qs
+
+    def list(self, request, *args, **kwargs):
+        # one catalog-wide version, replaced on every create, update and delete
+        version = get_courses_version()
+        path = hashlib.sha1(request.get_full_path().encode()).hexdigest()[:12]
+        return self.conditional(
+            request,
+            f'courses-{version}-{path}',
+            datetime.fromtimestamp(version / 1e9, tz=timezone.utc),
+            lambda: super(CourseViewSet, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        course = get_object_or_404(
+            Course.objects.only('version', 'modified'), pk=kwargs['pk']
+        )
+        return self.conditional(
+            request,
+            f'course-{course.pk}-{course.version}',
+            course.modified,
+            lambda: super(CourseViewSet, self).retrieve(request, *args, **kwargs),
+        )
 
     # implementation of additional action
     # after implement the additional action,
@@ -67,6 +154,104 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
         course.students.add(request.user)
         return Response({'enrolled': True})
 
+    # enroll users in many courses with a single request
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='enroll',
+        authentication_classes=[BasicAuthentication],
+        permission_classes=[IsAuthenticated]
+    )
+    def bulk_enroll(self, request, *args, **kwargs):
+        serializer = BulkEnrollSerializer(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        course_ids = serializer.validated_data['courses']
+        user_ids = serializer.validated_data.get('users', [request.user.id])
+        found = list(
+            Course.objects.filter(id__in=course_ids).values_list('id', flat=True)
+        )
+        added = enroll_users(found, user_ids)
+        results = []
+        for course_id in course_ids:
+            if course_id not in added:
+                results.append({'id': course_id, 'error': 'Not found.'})
+            else:
+                results.append({
+                    'id': course_id,
+                    'enrolled': len(added[course_id]),
+                    'already_enrolled': len(user_ids) - len(added[course_id]),
+                })
+        return Response({'results': results})
+
+    # export the courses of the instructor as JSON Lines; ?ids=1,2 to pick
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='export',
+        authentication_classes=[BasicAuthentication],
+        permission_classes=[IsAuthenticated]
+    )
+    def export(self, request, *args, **kwargs):
+        return StreamingHttpResponse(
+            transfer.export_lines(self.get_export_courses(request)),
+            content_type='application/x-ndjson',
+        )
+
+    # the files of the File and Image items as a tar stream
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='export/media',
+        authentication_classes=[BasicAuthentication],
+        permission_classes=[IsAuthenticated]
+    )
+    def export_media(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(
+            transfer.export_media(self.get_export_courses(request)),
+            content_type='application/x-tar',
+        )
+        response['Content-Disposition'] = 'attachment; filename="media.tar"'
+        return response
+
+    def get_export_courses(self, request):
+        courses = Course.objects.all()
+        if not request.user.is_staff:
+            courses = courses.filter(owner=request.user)
+        ids = request.query_params.get('ids')
+        if ids:
+            try:
+                courses = courses.filter(id__in=[int(pk) for pk in ids.split(',')])
+            except ValueError:
+                raise ValidationError({'ids': 'Must be a comma separated list of ids.'})
+        return courses
+
+    # import an export ("courses" file) and its media ("media" file)
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='import',
+        parser_classes=[MultiPartParser],
+        authentication_classes=[BasicAuthentication],
+        permission_classes=[IsAuthenticated]
+    )
+    def import_courses(self, request, *args, **kwargs):
+        if not request.user.has_perm('courses.add_course'):
+            raise PermissionDenied()
+        if 'courses' not in request.FILES:
+            return Response(
+                {'detail': 'A courses file is required.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            course_ids = transfer.import_courses(
+                request.FILES['courses'], request.user, request.FILES.get('media')
+            )
+        except transfer.TransferError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'courses': course_ids}, status=status.HTTP_201_CREATED)
+
     # second action
     @action(
         detail=True,
@@ -76,7 +261,89 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
         permission_classes=[IsAuthenticated, IsEnrolled]
     )
     def contents(self, request, *args, **kwargs):
-        return self.retrieve(request, *args, **kwargs)
+        # check the permissions on the bare course before anything else
+        course = get_object_or_404(
+            Course.objects.only('version', 'modified'), pk=kwargs['pk']
+        )
+        self.check_object_permissions(request, course)
+        return self.conditional(
+            request,
+            f'contents-{course.pk}-{course.version}',
+            course.modified,
+            lambda: self.contents_response(request, course.pk),
+        )
+
+    def contents_response(self, request, pk):
+        # dedicated read path, see CourseContentsSerializer
+        course = get_object_or_404(self.get_queryset(), pk=pk)
+        serializer = CourseContentsSerializer(course)
+        if request.query_params.get('stream'):
+            return StreamingHttpResponse(
+                serializer.stream(), content_type='application/json'
+            )
+        return Response(serializer.data)
+
+# chunked, resumable uploads of File and Image contents:
+# POST /uploads/ to start, PUT /uploads/<id>/ every chunk with the
+# Upload-Offset and Upload-Checksum (sha256) headers, GET /uploads/<id>/
+# to resume from "offset" and POST /uploads/<id>/complete/ at the end
+class UploadViewSet(mixins.CreateModelMixin,
+                    mixins.RetrieveModelMixin,
+                    viewsets.GenericViewSet):
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ChunkedUpload.objects.filter(owner=self.request.user)
+
+    def perform_create(self, serializer):
+        start_upload(serializer.save(owner=self.request.user))
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.data['chunk_size'] = UPLOAD_CHUNK_SIZE
+        return response
+
+    def update(self, request, *args, **kwargs):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+            checksum = request.headers['Upload-Checksum']
+        except (KeyError, ValueError):
+            return Response(
+                {'detail': 'Upload-Offset, Upload-Checksum and Content-Length '
+                           'headers are required.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            # the body is read straight from the request, never parsed
+            upload = write_chunk(upload, offset, length, request._request, checksum)
+        except OffsetMismatch as e:
+            return Response(
+                {'detail': str(e), 'offset': e.offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except UploadError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(upload).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, *args, **kwargs):
+        try:
+            upload = complete_upload(self.get_object())
+        except UploadError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(upload).data)
+
+# ranked full-text search over courses, modules and texts: ?q=words
+class SearchView(generics.ListAPIView):
+    serializer_class = SearchEntrySerializer
+    pagination_class = StandardPagination
+    permission_classes = [AllowAny]
+
+    def get_queryset(self):
+        return SearchResults(self.request.query_params.get('q', ''))
 
 # implementing custom API views
 """
@@ -0,0 +1,184 @@
+import time
+
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+# rendered content fragments are kept until the item changes; the shared
+# cache is their only store, a fragment evicted or lost with the cache is
+# rendered again on the next read
+FRAGMENT_TIMEOUT = None
+
+
+# rendered HTML of content items, stored per item and checked
+# against the item's updated timestamp
+def item_fragment_key(item):
+    return f"item_fragment:{item._meta.model_name}:{item.pk}"
+
+
+def store_fragments(items):
+    fragments = {}
+    for item in items:
+        item._rendered = item.render_template()
+        fragments[item_fragment_key(item)] = (item.updated, str(item._rendered))
+    cache.set_many(fragments, FRAGMENT_TIMEOUT)
+
+
+def prime_fragments(items):
+    # load the stored fragments of many items with a single lookup
+    items = [item for item in items if item is not None]
+    stored = cache.get_many([item_fragment_key(item) for item in items])
+    stale = []
+    for item in items:
+        updated, html = stored.get(item_fragment_key(item), (None, None))
+        if updated == item.updated:
+            item._rendered = mark_safe(html)
+        else:
+            stale.append(item)
+    if stale:
+        store_fragments(stale)
+
+
+def delete_fragment(item):
+    cache.delete(item_fragment_key(item))
+
+
+# public catalog: compact rows, versioned per subject ("all" covers the
+# subject list and the full course list)
+CATALOG_TIMEOUT = 60 * 15
+# stale rows are kept around to be served while they are recomputed
+CATALOG_STALE_TIMEOUT = 60 * 60 * 24
+CATALOG_LOCK_TIMEOUT = 30
+# how long a worker waits for the first rows computed by another one
+CATALOG_WAIT_TIMEOUT = 2
+CATALOG_WAIT_INTERVAL = 0.05
+
+
+def catalog_version_key(scope):
+    return f"catalog_version:{scope}"
+
+
+def get_catalog_version(scope="all"):
+    return cache.get_or_set(catalog_version_key(scope), time.time_ns, None)
+
+
+def get_catalog_versions(scopes):
+    # versions of many subjects with a single lookup
+    keys = {scope: catalog_version_key(scope) for scope in scopes}
+    stored = cache.get_many(keys.values())
+    missing = {key: time.time_ns() for key in keys.values() if key not in stored}
+    if missing:
+        cache.set_many(missing, None)
+    return {scope: stored.get(key, missing.get(key)) for scope, key in keys.items()}
+
+
+def bump_catalog_version(*subject_ids):
+    # versions are timestamps so an evicted counter can never come back
+    # with a value that matches an older entry
+    subject_ids = [pk for pk in subject_ids if pk is not None]
+    scopes = {"all", *subject_ids, *map(popular_scope, subject_ids)}
+    version = time.time_ns()
+    cache.set_many({catalog_version_key(scope): version for scope in scopes}, None)
+
+
+# the popular courses of a subject are the only rows depending on the
+# enrollments, they have a scope of their own
+def popular_scope(subject_id):
+    return f"popular:{subject_id}"
+
+
+def bump_popular_version(*subject_ids):
+    version = time.time_ns()
+    cache.set_many(
+        {catalog_version_key(popular_scope(pk)): version for pk in subject_ids},
+        None,
+    )
+
+
+def get_catalog_rows(key, version, compute):
+    entry = cache.get(key)
+    now = time.time()
+    lock_key = f"{key}:lock"
+    if entry is not None:
+        entry_version, fresh_until, rows = entry
+        if entry_version == version and now < fresh_until:
+            return rows
+        # only one worker recomputes, the others serve the stale rows
+        if not cache.add(lock_key, True, CATALOG_LOCK_TIMEOUT):
+            return rows
+        locked = True
+    else:
+        locked = cache.add(lock_key, True, CATALOG_LOCK_TIMEOUT)
+        if not locked:
+            # nothing to serve yet, wait for the rows of the worker
+            # computing them
+            entry = wait_for_entry(key)
+            if entry is not None:
+                return entry[2]
+    try:
+        rows = compute()
+        cache.set(key, (version, now + CATALOG_TIMEOUT, rows), CATALOG_STALE_TIMEOUT)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return rows
+
+
+def wait_for_entry(key):
+    # None when the rows did not show up in time
+    deadline = time.monotonic() + CATALOG_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(CATALOG_WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+# version of the full course list of the API, replaced by every create,
+# update and delete of a course or of its modules
+COURSES_VERSION_KEY = "courses_version"
+
+
+def get_courses_version():
+    return cache.get_or_set(COURSES_VERSION_KEY, time.time_ns, None)
+
+
+def bump_courses_version():
+    cache.set(COURSES_VERSION_KEY, time.time_ns(), None)
+
+
+# most enrolled courses of each subject
+def popular_courses_key(subject_id, version):
+    return f"popular_courses:{subject_id}:{version}"
+
+
+def get_popular_courses(subject_ids, compute):
+    versions = get_catalog_versions(map(popular_scope, subject_ids))
+    keys = {
+        pk: popular_courses_key(pk, versions[popular_scope(pk)]) for pk in subject_ids
+    }
+    stored = cache.get_many(keys.values())
+    popular = {pk: stored[key] for pk, key in keys.items() if key in stored}
+    missing = [pk for pk in subject_ids if pk not in popular]
+    if missing:
+        computed = compute(missing)
+        cache.set_many(
+            {keys[pk]: computed[pk] for pk in missing}, CATALOG_STALE_TIMEOUT
+        )
+        popular.update(computed)
+    return popular
+
+
+# module navigation of a course, keyed on the course version so any change
+# of the course replaces it
+def course_modules_key(course):
+    return f"course_modules:{course.pk}:{course.version}"
+
+
+# rendered contents of a module, keyed on its contents version; the
+# version changes with every edit so the fragment can live for long
+MODULE_CONTENTS_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def module_contents_key(module_id, contents_version):
+    return f"module_contents:{module_id}:{contents_version}"
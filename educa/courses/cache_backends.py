@@ -0,0 +1,291 @@
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+# every value of the shared tier has a stamp stored next to it, replaced by
+# each write; local copies are dropped once their stamp changed
+STAMP_PREFIX = "tiered_cache:stamp:"
+# replaced by clear(), so the other processes drop everything
+EPOCH_KEY = "tiered_cache:epoch"
+
+# local stores are per process, shared by the cache instances of all threads
+_stores = {}
+_stores_lock = threading.Lock()
+
+_MISSING = object()
+
+
+def new_stamp():
+    return uuid.uuid4().hex
+
+
+class LocalStore:
+    # bounded LRU of values that expire after a few seconds, each with the
+    # stamp it had in the shared tier
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        # local key -> (expires, stamp, value, key, version)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.epoch = _MISSING
+        self.next_sync = 0
+        self.stats = Counter()
+
+    def get(self, local_key):
+        with self.lock:
+            entry = self.entries.get(local_key)
+            if entry is None:
+                return _MISSING
+            if entry[0] <= time.monotonic():
+                del self.entries[local_key]
+                return _MISSING
+            self.entries.move_to_end(local_key)
+            return entry[2]
+
+    def set(self, local_key, value, stamp, timeout, key, version):
+        with self.lock:
+            self.entries[local_key] = (
+                time.monotonic() + timeout,
+                stamp,
+                value,
+                key,
+                version,
+            )
+            self.entries.move_to_end(local_key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, *local_keys):
+        with self.lock:
+            for local_key in local_keys:
+                self.entries.pop(local_key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stamps(self):
+        # {version: {key: (local key, stamp)}} of the live entries
+        now = time.monotonic()
+        stamps = {}
+        with self.lock:
+            for local_key, (expires, stamp, _, key, version) in self.entries.items():
+                if expires > now:
+                    stamps.setdefault(version, {})[key] = (local_key, stamp)
+        return stamps
+
+    def drop_changed(self, changed):
+        # changed: (local key, stamp) pairs; entries replaced in the
+        # meantime are kept
+        with self.lock:
+            for local_key, stamp in changed:
+                entry = self.entries.get(local_key)
+                if entry is not None and entry[1] == stamp:
+                    del self.entries[local_key]
+
+    def synced_epoch(self, epoch):
+        with self.lock:
+            if self.epoch is not _MISSING and epoch != self.epoch:
+                self.entries.clear()
+            self.epoch = epoch
+
+    def expire_sync(self):
+        # check the stamps on the next access
+        self.next_sync = 0
+
+    def count(self, tier, hits=0, misses=0):
+        with self.lock:
+            self.stats[f"{tier}_hits"] += hits
+            self.stats[f"{tier}_misses"] += misses
+
+
+class TieredCache(BaseCache):
+    """
+    A small per-process LRU (L1) in front of a shared cache (L2).
+
+    OPTIONS:
+        L2: settings of the shared cache, in the CACHES format
+        L1_TIMEOUT: seconds a value is served from the local tier
+        SYNC_INTERVAL: seconds between two checks of the stamps
+        MAX_ENTRIES: size of the local tier
+
+    Every write stores a new stamp next to the value in the same L2 call.
+    The stamps of the local entries are checked with one get_many() every
+    SYNC_INTERVAL seconds, however many requests the process serves, and
+    only the entries whose stamp changed are dropped. The writes of other
+    processes are seen within SYNC_INTERVAL seconds, the process's own
+    writes right away. Values from the local tier are shared between
+    threads and must not be modified.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        shared = dict(options["L2"])
+        backend = import_string(shared.pop("BACKEND"))
+        self.shared = backend(shared.pop("LOCATION", ""), shared)
+        self.local_timeout = options.get("L1_TIMEOUT", 5)
+        self.sync_interval = options.get("SYNC_INTERVAL", 1)
+        with _stores_lock:
+            if location not in _stores:
+                _stores[location] = LocalStore(self._max_entries)
+            self.local = _stores[location]
+
+    def _local_key(self, key, version=None):
+        return self.shared.make_and_validate_key(key, version=version)
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.shared.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def _remember(self, key, version, value, stamp, timeout=DEFAULT_TIMEOUT):
+        local_key = self._local_key(key, version)
+        timeout = self._local_timeout(timeout)
+        if timeout > 0:
+            self.local.set(local_key, value, stamp, timeout, key, version)
+        else:
+            self.local.delete(local_key)
+
+    def _sync(self):
+        now = time.monotonic()
+        if now < self.local.next_sync:
+            return
+        self.local.next_sync = now + self.sync_interval
+        changed = []
+        groups = self.local.stamps()
+        # the epoch is read with the stamps of the default version
+        groups.setdefault(None, {})
+        for version, entries in groups.items():
+            keys = [STAMP_PREFIX + key for key in entries]
+            current = self.shared.get_many(
+                keys + [EPOCH_KEY] if version is None else keys, version=version
+            )
+            if version is None:
+                self.local.synced_epoch(current.get(EPOCH_KEY))
+            changed.extend(
+                (local_key, stamp)
+                for key, (local_key, stamp) in entries.items()
+                if current.get(STAMP_PREFIX + key) != stamp
+            )
+        self.local.drop_changed(changed)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(self._local_key(key, version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self.local.count("l1", hits=len(found), misses=len(missing))
+        if missing:
+            # the values and their stamps in one call
+            shared = self.shared.get_many(
+                missing + [STAMP_PREFIX + key for key in missing], version=version
+            )
+            hits = [key for key in missing if key in shared]
+            self.local.count("l2", hits=len(hits), misses=len(missing) - len(hits))
+            for key in hits:
+                found[key] = shared[key]
+                self._remember(
+                    key, version, shared[key], shared.get(STAMP_PREFIX + key)
+                )
+        return found
+
+    def has_key(self, key, version=None):
+        self._sync()
+        if self.local.get(self._local_key(key, version)) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # only fills a missing key, nobody can hold a copy to invalidate; the
+        # copies of a later write have a stamp and differ from it
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._remember(key, version, value, None, timeout)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if not data:
+            return []
+        stamps = {key: new_stamp() for key in data}
+        failed = self.shared.set_many(
+            {
+                **data,
+                **{STAMP_PREFIX + key: stamp for key, stamp in stamps.items()},
+            },
+            timeout,
+            version=version,
+        )
+        failed = [key for key in failed if not key.startswith(STAMP_PREFIX)]
+        for key, value in data.items():
+            if key in failed:
+                self.local.delete(self._local_key(key, version))
+            else:
+                self._remember(key, version, value, stamps[key], timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.delete(self._local_key(key, version))
+        touched = self.shared.touch(key, timeout, version=version)
+        self.shared.touch(STAMP_PREFIX + key, timeout, version=version)
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self.shared.set(STAMP_PREFIX + key, new_stamp(), None, version=version)
+        self.local.delete(self._local_key(key, version))
+        return value
+
+    def delete(self, key, version=None):
+        deleted = self.shared.delete(key, version=version)
+        # a missing stamp differs from the stamp of every local copy
+        self.shared.delete(STAMP_PREFIX + key, version=version)
+        self.local.delete(self._local_key(key, version))
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return
+        self.shared.delete_many(
+            keys + [STAMP_PREFIX + key for key in keys], version=version
+        )
+        self.local.delete(*(self._local_key(key, version) for key in keys))
+
+    def clear(self):
+        self.shared.clear()
+        self.shared.set(EPOCH_KEY, new_stamp(), None)
+        self.local.clear()
+        self.local.synced_epoch(self.shared.get(EPOCH_KEY))
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def stats(self):
+        # hit and miss counters of both tiers for this process
+        with self.local.lock:
+            return {
+                tier: {
+                    "hits": self.local.stats[f"{tier}_hits"],
+                    "misses": self.local.stats[f"{tier}_misses"],
+                }
+                for tier in ("l1", "l2")
+            }
@@ -0,0 +1,104 @@
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .cache import (
+    CATALOG_STALE_TIMEOUT,
+    MODULE_CONTENTS_TIMEOUT,
+    course_modules_key,
+    get_catalog_rows,
+    get_catalog_version,
+    get_popular_courses,
+    module_contents_key,
+    prime_fragments,
+)
+from .models import Content, Course, Subject
+
+
+# evaluated rows of the public catalog, cached by courses.cache
+def subject_rows():
+    return list(Subject.objects.values("id", "title", "slug", "total_courses"))
+
+
+def course_rows(subject_id=None):
+    courses = Course.objects.for_catalog()
+    if subject_id:
+        courses = courses.filter(subject_id=subject_id)
+    return [
+        {
+            "id": course.id,
+            "title": course.title,
+            "slug": course.slug,
+            "total_modules": course.total_modules,
+            "subject_title": course.subject.title,
+            "subject_slug": course.subject.slug,
+            "owner_name": course.owner.get_full_name(),
+        }
+        for course in courses
+    ]
+
+
+def popular_course_rows(subject_ids, limit=3):
+    # the top courses of every subject in a single windowed query
+    courses = (
+        Course.objects.filter(subject_id__in=subject_ids)
+        .annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=F("subject_id"),
+                order_by=[F("total_students").desc(), F("id")],
+            )
+        )
+        .filter(rank__lte=limit)
+        .order_by("subject_id", "rank")
+        .values_list("subject_id", "title", "total_students")
+    )
+    rows = {pk: [] for pk in subject_ids}
+    for subject_id, title, total_students in courses:
+        rows[subject_id].append((title, total_students))
+    return rows
+
+
+def get_subjects():
+    return get_catalog_rows("catalog:subjects", get_catalog_version(), subject_rows)
+
+
+def get_courses(subject=None):
+    if subject is None:
+        return get_catalog_rows(
+            "catalog:courses:all", get_catalog_version(), course_rows
+        )
+    return get_catalog_rows(
+        f"catalog:courses:{subject.id}",
+        get_catalog_version(subject.id),
+        lambda: course_rows(subject.id),
+    )
+
+
+def get_popular(subject_ids):
+    return get_popular_courses(subject_ids, popular_course_rows)
+
+
+def get_course_modules(course):
+    key = course_modules_key(course)
+    modules = cache.get(key)
+    if modules is None:
+        modules = list(
+            course.modules.values("id", "order", "title", "contents_version")
+        )
+        cache.set(key, modules, CATALOG_STALE_TIMEOUT)
+    return modules
+
+
+def get_module_contents(module_id, contents_version):
+    key = module_contents_key(module_id, contents_version)
+    html = cache.get(key)
+    if html is None:
+        contents = list(Content.objects.filter(module_id=module_id).with_items())
+        # serve the stored fragments of all contents with one lookup
+        prime_fragments([content.item for content in contents])
+        html = render_to_string("courses/module/contents.html", {"contents": contents})
+        cache.set(key, html, MODULE_CONTENTS_TIMEOUT)
+    return mark_safe(html)
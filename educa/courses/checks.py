@@ -0,0 +1,25 @@
+from django.core.checks import Tags, Warning, register
+from django.db import connections
+
+from . import search
+
+
+@register(Tags.database)
+def check_search_index(app_configs, databases=None, **kwargs):
+    # a migration rebuilding the search entries table on SQLite drops the
+    # triggers filling the text index
+    warnings = []
+    for alias in databases or []:
+        if search.TABLE not in connections[alias].introspection.table_names():
+            continue
+        missing = search.missing_index(alias)
+        if missing:
+            warnings.append(
+                Warning(
+                    f"The search index of '{alias}' is missing "
+                    f"{', '.join(missing)}.",
+                    hint="Run manage.py rebuild_search_index to recreate it.",
+                    id="courses.W001",
+                )
+            )
+    return warnings
@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import bump_courses_version
+from .models import Course, Module, Subject
+
+
+# denormalized counters, kept up to date by courses.signals in the
+# transaction of the row write: saves are atomic through CountersMixin,
+# deletes and m2m changes through Django itself
+def _count(queryset, field):
+    # correlated COUNT(*) of the rows of queryset pointing at the outer row
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+def recount_courses(subject_ids=None):
+    subjects = Subject.objects.all()
+    if subject_ids is not None:
+        subjects = subjects.filter(pk__in=subject_ids)
+    return subjects.update(total_courses=_count(Course.objects.all(), "subject"))
+
+
+def recount_modules(course_ids=None):
+    courses = Course.objects.all()
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+    return courses.update(total_modules=_count(Module.objects.all(), "course"))
+
+
+def recount_students(course_ids=None):
+    courses = Course.objects.all()
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+    return courses.update(
+        total_students=_count(Course.students.through.objects.all(), "course")
+    )
+
+
+def add_courses(subject_id, amount):
+    Subject.objects.filter(pk=subject_id).update(
+        total_courses=F("total_courses") + amount
+    )
+
+
+def move_course(old_subject_id, new_subject_id):
+    with transaction.atomic():
+        add_courses(old_subject_id, -1)
+        add_courses(new_subject_id, 1)
+
+
+def add_modules(course_id, amount):
+    Course.objects.filter(pk=course_id).update(
+        total_modules=F("total_modules") + amount
+    )
+
+
+def bump_course_version(**filters):
+    # e.g. bump_course_version(modules__contents__module=module_id)
+    if Course.objects.filter(**filters).update(
+        version=F("version") + 1, modified=timezone.now()
+    ):
+        # after the commit, so the list is never cached under the new
+        # version with the old rows
+        transaction.on_commit(bump_courses_version)
+
+
+def bump_contents_version(**filters):
+    # e.g. bump_contents_version(contents__object_id=item_id, ...)
+    Module.objects.filter(**filters).update(contents_version=F("contents_version") + 1)
@@ -0,0 +1,135 @@
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import (
+    content_disposition_header,
+    http_date,
+    parse_http_date_safe,
+)
+from django.views.static import serve
+
+# media only sent by ItemDownloadView: the upload_to directories of File
+# and Image items, except for the image variants stored below them
+PROTECTED_MEDIA = ("files/", "images/")
+PUBLIC_MEDIA = ("images/variants/",)
+
+# single byte ranges: "bytes=0-499", "bytes=500-" or "bytes=-500"
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeFile:
+    # a window of an open file; fileno() is kept so WSGI servers can still
+    # use sendfile() from the current position
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    # (first, last) byte of a single range, None to send the whole file;
+    # raises ValueError for a range outside of the file
+    match = RANGE_RE.match(header or "")
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # the last bytes of the file
+        if int(last) == 0:
+            raise ValueError(header)
+        return max(size - int(last), 0), size - 1
+    first, last = int(first), min(int(last), size - 1) if last else size - 1
+    if first >= size:
+        raise ValueError(header)
+    return (first, last) if first <= last else None
+
+
+def sendfile_response(field_file, filename, as_attachment):
+    # let the web server send the file
+    content_type, _ = mimetypes.guess_type(filename)
+    response = HttpResponse(content_type=content_type or "application/octet-stream")
+    if settings.MEDIA_SENDFILE == "x-accel-redirect":
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(
+            field_file.name
+        )
+    else:
+        response["X-Sendfile"] = field_file.path
+    response["Content-Disposition"] = content_disposition_header(
+        as_attachment, filename
+    )
+    return response
+
+
+def serve_file(request, field_file, last_modified, as_attachment=True, filename=None):
+    filename = filename or os.path.basename(field_file.name)
+    if getattr(settings, "MEDIA_SENDFILE", None):
+        return sendfile_response(field_file, filename, as_attachment)
+
+    timestamp = int(last_modified.timestamp())
+    response = get_conditional_response(request, last_modified=timestamp)
+    if response is not None:
+        return response
+    try:
+        size = field_file.size
+        file = field_file.storage.open(field_file.name, "rb")
+    except (FileNotFoundError, ValueError):
+        # a row whose file is gone, or an item without a file
+        raise Http404("No file found for the item")
+    try:
+        byte_range = parse_range(request.headers.get("Range"), size)
+    except ValueError:
+        file.close()
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    if_range = request.headers.get("If-Range")
+    if byte_range and if_range and parse_http_date_safe(if_range) != timestamp:
+        # the file changed since the first part was downloaded
+        byte_range = None
+
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=as_attachment, filename=filename)
+    else:
+        first, last = byte_range
+        response = FileResponse(
+            RangeFile(file, first, last - first + 1),
+            as_attachment=as_attachment,
+            filename=filename,
+            status=206,
+        )
+        response["Content-Length"] = last - first + 1
+        response["Content-Range"] = f"bytes {first}-{last}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    response["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+def is_protected(name):
+    name = posixpath.normpath(name).lstrip("/")
+    return name.startswith(PROTECTED_MEDIA) and not name.startswith(PUBLIC_MEDIA)
+
+
+def serve_public_media(request, path, document_root=None):
+    # MEDIA_ROOT as served in development, without the originals
+    if is_protected(path):
+        raise Http404("Served by the item download view")
+    return serve(request, path, document_root=document_root)
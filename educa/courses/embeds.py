@@ -0,0 +1,85 @@
+import logging
+
+from embed_video.backends import EmbedVideoException, SoundCloudBackend, detect_backend
+from embed_video.templatetags.embed_video_tags import VideoNode
+from requests import RequestException
+
+from .models import Video
+from .tasks import run_in_background, save_if_unchanged
+
+logger = logging.getLogger(__name__)
+
+# the embed code is rendered once per url and stored on the Video item, the
+# templates only output it
+EMBED_SIZE = "small"
+# providers whose embed code comes from their oEmbed endpoint
+REMOTE_BACKENDS = (SoundCloudBackend,)
+
+
+def get_backend(url):
+    try:
+        return detect_backend(url)
+    except EmbedVideoException:
+        return None
+
+
+def get_embed_html(backend):
+    return backend.get_embed_code(*VideoNode.get_size(EMBED_SIZE)).strip()
+
+
+def parse_url(url):
+    # the metadata found in the url itself, without network access
+    fields = {
+        "resolved_url": url,
+        "provider": "",
+        "video_id": "",
+        "embed_html": "",
+        "thumbnail_url": "",
+    }
+    backend = get_backend(url)
+    if backend is None:
+        return fields
+    fields["provider"] = type(backend).__name__.removesuffix("Backend").lower()
+    if not isinstance(backend, REMOTE_BACKENDS):
+        try:
+            fields["video_id"] = backend.code
+            fields["embed_html"] = get_embed_html(backend)
+        except EmbedVideoException:
+            pass
+    return fields
+
+
+def resolve_video(video):
+    # returns whether the rest of the metadata is to be fetched
+    for name, value in parse_url(video.url).items():
+        setattr(video, name, value)
+    return bool(video.provider)
+
+
+def schedule_metadata(video_ids):
+    for pk in video_ids:
+        run_in_background(fetch_metadata, pk)
+
+
+def fetch_metadata(video_id):
+    # thumbnails, and the embed code of oEmbed providers, need requests to
+    # the provider
+    video = Video.objects.filter(pk=video_id).first()
+    if video is None or video.resolved_url != video.url:
+        return
+    backend = get_backend(video.url)
+    if backend is None:
+        return
+    fields = {}
+    try:
+        if not video.embed_html:
+            fields["video_id"] = backend.code
+            fields["embed_html"] = get_embed_html(backend)
+        fields["thumbnail_url"] = backend.thumbnail or ""
+    except (EmbedVideoException, RequestException, ValueError) as e:
+        logger.warning("Could not fetch the metadata of video %s: %s", video_id, e)
+    if not fields:
+        return
+
+    # the url may have been changed in the meantime
+    save_if_unchanged(Video, video_id, fields, resolved_url=video.url)
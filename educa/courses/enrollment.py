@@ -0,0 +1,123 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+
+from .models import Course
+
+# rows are inserted in batches of this size
+ENROLL_BATCH_SIZE = 1000
+# enrolled course ids are rebuilt lazily after they are invalidated; versions
+# are timestamps so an evicted one never comes back with an older value
+ENROLLMENT_TIMEOUT = 60 * 60 * 24
+
+
+# per-user set of enrolled course ids, so checking access to a course is
+# a set lookup instead of a join on the enrollment table. The sets are
+# keyed on a version replaced after every change, so a set loaded before
+# the change and stored after it is never read
+def enrolled_courses_version_key(user_id):
+    return f"enrolled_courses_version:{user_id}"
+
+
+def enrolled_courses_key(user_id, version):
+    return f"enrolled_courses:{user_id}:{version}"
+
+
+def get_enrolled_course_ids(user):
+    if not user.is_authenticated:
+        return frozenset()
+    # kept on the user object for the rest of the request
+    course_ids = getattr(user, "_enrolled_course_ids", None)
+    if course_ids is None:
+        version = cache.get_or_set(
+            enrolled_courses_version_key(user.pk), time.time_ns, ENROLLMENT_TIMEOUT
+        )
+        key = enrolled_courses_key(user.pk, version)
+        course_ids = cache.get(key)
+        if course_ids is None:
+            course_ids = load_enrolled_course_ids(user.pk)
+            cache.set(key, course_ids, ENROLLMENT_TIMEOUT)
+        user._enrolled_course_ids = course_ids
+    return course_ids
+
+
+def load_enrolled_course_ids(user_id):
+    return frozenset(
+        Course.students.through.objects.filter(user_id=user_id).values_list(
+            "course_id", flat=True
+        )
+    )
+
+
+def is_enrolled(user, course_id):
+    try:
+        return int(course_id) in get_enrolled_course_ids(user)
+    except (TypeError, ValueError):
+        return False
+
+
+def forget_enrollments(user_ids):
+    # replace the versions once the change is committed, so the new sets
+    # are never loaded from data that is about to change
+    keys = [enrolled_courses_version_key(pk) for pk in user_ids]
+    transaction.on_commit(
+        lambda: cache.set_many(dict.fromkeys(keys, time.time_ns()), ENROLLMENT_TIMEOUT)
+    )
+
+
+def enroll_users(course_ids, user_ids):
+    # enroll every user in every course with bulk INSERTs and return the
+    # ids of the users newly enrolled in each course
+    Enrollment = Course.students.through
+    existing = set(
+        Enrollment.objects.filter(
+            course_id__in=course_ids, user_id__in=user_ids
+        ).values_list("course_id", "user_id")
+    )
+    added = {
+        course_id: [
+            user_id for user_id in user_ids if (course_id, user_id) not in existing
+        ]
+        for course_id in course_ids
+    }
+    Enrollment.objects.bulk_create(
+        [
+            Enrollment(course_id=course_id, user_id=user_id)
+            for course_id, new_user_ids in added.items()
+            for user_id in new_user_ids
+        ],
+        batch_size=ENROLL_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    send_enrolled(added)
+    return added
+
+
+def send_enrolled(added):
+    # bulk_create() sends no m2m_changed signal; send the post_add signal
+    # Course.students.add() would have sent, from the user when a single
+    # user joins many courses and from each course otherwise
+    Enrollment = Course.students.through
+    User = Course.students.field.related_model
+    user_ids = {pk for new_user_ids in added.values() for pk in new_user_ids}
+    if len(user_ids) == 1:
+        course_ids = {pk for pk, new_user_ids in added.items() if new_user_ids}
+        senders = [(User(pk=user_ids.pop()), True, Course, course_ids)]
+    else:
+        senders = [
+            (Course(pk=pk), False, User, set(new_user_ids))
+            for pk, new_user_ids in added.items()
+            if new_user_ids
+        ]
+    for instance, reverse, model, pk_set in senders:
+        m2m_changed.send(
+            sender=Enrollment,
+            instance=instance,
+            action="post_add",
+            reverse=reverse,
+            model=model,
+            pk_set=pk_set,
+            using=Enrollment.objects.db,
+        )
@@ -1,5 +1,6 @@
-from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.apps import apps
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Max
 
 
 class OrderField(models.PositiveIntegerField):
@@ -8,25 +9,82 @@ class OrderField(models.PositiveIntegerField):
         self.for_fields = for_fields
         super().__init__(*args, **kwargs)
 
+    def parent_values(self, model_instance):
+        # values of the fields in "for_fields" identifying the parent
+        return {
+            self.model._meta.get_field(field).attname: getattr(
+                model_instance, self.model._meta.get_field(field).attname
+            )
+            for field in self.for_fields or []
+        }
+
+    def sequence_key(self, model_instance):
+        return self.parent_key(self.parent_values(model_instance))
+
+    def parent_key(self, values):
+        parent = ",".join(f"{name}={value}" for name, value in values.items())
+        return f"{self.model._meta.label_lower}.{self.attname}:{parent}"
+
+    def reserve(self, model_instance, count=1):
+        # hand out "count" consecutive positions from the sequence row of
+        # the parent; the row is locked by the UPDATE until the end of the
+        # transaction, so concurrent inserts never get the same position
+        OrderSequence = apps.get_model("courses", "OrderSequence")
+        key = self.sequence_key(model_instance)
+        with transaction.atomic():
+            sequences = OrderSequence.objects.filter(key=key)
+            if not sequences.update(last=F("last") + count):
+                self.create_sequence(model_instance, key)
+                sequences.update(last=F("last") + count)
+            last = sequences.values_list("last", flat=True).get()
+        return last - count + 1
+
+    def create_sequence(self, model_instance, key):
+        # the first insert of a parent starts after its existing items
+        OrderSequence = apps.get_model("courses", "OrderSequence")
+        last = self.model._default_manager.filter(
+            **self.parent_values(model_instance)
+        ).aggregate(last=Max(self.attname))["last"]
+        try:
+            with transaction.atomic():
+                OrderSequence.objects.create(key=key, last=-1 if last is None else last)
+        except IntegrityError:
+            # created by a concurrent insert
+            pass
+
+    def advance(self, model_instance, value):
+        # keep the sequence ahead of positions that were set explicitly
+        OrderSequence = apps.get_model("courses", "OrderSequence")
+        OrderSequence.objects.filter(
+            key=self.sequence_key(model_instance), last__lt=value
+        ).update(last=value)
+
+    def delete_sequence(self, **values):
+        # once the parent is deleted, e.g. delete_sequence(course_id=pk)
+        OrderSequence = apps.get_model("courses", "OrderSequence")
+        OrderSequence.objects.filter(key=self.parent_key(values)).delete()
+
     def pre_save(self, model_instance, add):
         if getattr(model_instance, self.attname) is None:
             # no current value
-            try:
-                qs = self.model.objects.all()
-                if self.for_fields:
-                    # filter by objects with the same field values
-                    # for the fields in "for_fields"
-                    query = {
-                        field: getattr(model_instance, field)
-                        for field in self.for_fields
-                    }
-                    qs = qs.filter(**query)
-                # get the order of the last item
-                last_item = qs.latest(self.attname)
-                value = getattr(last_item, self.attname) + 1
-            except ObjectDoesNotExist:
-                value = 0
+            value = self.reserve(model_instance)
             setattr(model_instance, self.attname, value)
             return value
         else:
             return super().pre_save(model_instance, add)
+
+
+def bulk_create_ordered(model, objs, batch_size=None):
+    # give objects without a position contiguous positions per parent and
+    # insert all of them with bulk_create()
+    fields = [f for f in model._meta.concrete_fields if isinstance(f, OrderField)]
+    for field in fields:
+        parents = {}
+        for obj in objs:
+            if getattr(obj, field.attname) is None:
+                parents.setdefault(field.sequence_key(obj), []).append(obj)
+        for children in parents.values():
+            first = field.reserve(children[0], len(children))
+            for position, obj in enumerate(children, first):
+                setattr(obj, field.attname, position)
+    return model.objects.bulk_create(objs, batch_size=batch_size)
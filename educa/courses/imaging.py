@@ -0,0 +1,74 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+from .models import Image
+from .tasks import run_in_background, save_if_unchanged
+
+# resized copies of Image items: name -> (longest side, format, extension)
+VARIANTS = {
+    "content": (1280, "JPEG", "jpg"),
+    "webp": (1280, "WEBP", "webp"),
+}
+VARIANT_OPTIONS = {
+    "JPEG": {"quality": 82, "optimize": True, "progressive": True},
+    "WEBP": {"quality": 80, "method": 4},
+}
+# variants are plain copies in the default storage, owned by one image
+VARIANT_DIR = "images/variants"
+
+
+def schedule_variants(image_ids):
+    for pk in image_ids:
+        run_in_background(generate_variants, pk)
+
+
+def render_variant(original, size, format):
+    image = original.copy()
+    image.thumbnail((size, size))
+    if format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format, **VARIANT_OPTIONS[format])
+    return buffer.getvalue()
+
+
+def delete_variants(variants):
+    for path in variants.get("files", {}).values():
+        default_storage.delete(path)
+
+
+def generate_variants(image_id):
+    image = Image.objects.filter(pk=image_id).only("file", "variants").first()
+    if image is None or not image.file:
+        return
+    source = image.file.name
+    if image.variants.get("source") == source:
+        return
+    stem = os.path.splitext(os.path.basename(source))[0]
+    files = {}
+    try:
+        with image.file.open("rb") as f:
+            original = ImageOps.exif_transpose(PILImage.open(f))
+            for name, (size, format, extension) in VARIANTS.items():
+                files[name] = default_storage.save(
+                    f"{VARIANT_DIR}/{stem}-{size}.{extension}",
+                    ContentFile(render_variant(original, size, format)),
+                )
+    except (OSError, PILImage.DecompressionBombError):
+        # not an image Pillow can read, only the original can be downloaded
+        delete_variants({"files": files})
+        files = {}
+
+    # the file may have been replaced in the meantime
+    previous = save_if_unchanged(
+        Image, image_id, {"variants": {"source": source, "files": files}}, file=source
+    )
+    if previous is None:
+        delete_variants({"files": files})
+        return
+    delete_variants(previous["variants"])
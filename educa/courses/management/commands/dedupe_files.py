@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from courses.models import File, Image
+from courses.storage import content_storage, is_content_addressed, release_file
+
+
+class Command(BaseCommand):
+    help = "Move the files of File and Image items to the content-addressed storage"
+
+    def handle(self, *args, **options):
+        moved = 0
+        for model in (File, Image):
+            items = model.objects.exclude(file="")
+            if model is File:
+                items = items.only("file")
+            else:
+                items = items.only("file", "variants")
+            for item in items.iterator():
+                name = item.file.name
+                if is_content_addressed(name) or not content_storage.exists(name):
+                    continue
+                with transaction.atomic():
+                    # the storage locks the new file until the row points at it
+                    with item.file.open("rb"):
+                        new_name = content_storage.save(name, item.file)
+                    changes = {"file": new_name}
+                    if model is Image and item.variants.get("source") == name:
+                        # the variants were made from the same content
+                        changes["variants"] = {**item.variants, "source": new_name}
+                    # an update keeps the items and their fragments untouched
+                    model.objects.filter(pk=item.pk, file=name).update(**changes)
+                    release_file(name)
+                moved += 1
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} files"))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from courses.uploads import UPLOAD_EXPIRY, expire_uploads
+
+
+class Command(BaseCommand):
+    help = "Remove the chunked uploads abandoned before completion"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=float,
+            default=UPLOAD_EXPIRY / timedelta(hours=1),
+            help="Age of the last chunk after which an upload is abandoned",
+        )
+
+    def handle(self, *args, **options):
+        removed = expire_uploads(timedelta(hours=options["hours"]))
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} abandoned uploads"))
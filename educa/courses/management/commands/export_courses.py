@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import Course
+from courses.transfer import export_lines, export_media
+
+
+class Command(BaseCommand):
+    help = "Export courses with their modules and contents as JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument("course_ids", nargs="*", type=int, help="Default: all")
+        parser.add_argument(
+            "--output", help="File to write the records to, default stdout"
+        )
+        parser.add_argument("--media", help="Tar file to write the media files to")
+
+    def handle(self, *args, **options):
+        courses = Course.objects.all()
+        if options["course_ids"]:
+            courses = courses.filter(id__in=options["course_ids"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                output.writelines(export_lines(courses))
+        else:
+            self.stdout.ending = ""
+            for line in export_lines(courses):
+                self.stdout.write(line)
+        if options["media"]:
+            with open(options["media"], "wb") as output:
+                output.writelines(export_media(courses))
+        if options["output"]:
+            self.stdout.write(self.style.SUCCESS(f"Exported to {options['output']}"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from courses.embeds import fetch_metadata, parse_url
+from courses.models import Video
+
+
+class Command(BaseCommand):
+    help = "Resolve the embed code and thumbnail of Video contents missing them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Resolve the metadata of every video again",
+        )
+
+    def handle(self, *args, **options):
+        videos = Video.objects.only("url", "resolved_url").order_by("pk")
+        if not options["all"]:
+            videos = videos.exclude(resolved_url=F("url"), thumbnail_url__gt="")
+        videos = list(videos)
+        for n, video in enumerate(videos, 1):
+            if options["all"] or video.resolved_url != video.url:
+                Video.objects.filter(pk=video.pk).update(**parse_url(video.url))
+            fetch_metadata(video.pk)
+            if options["verbosity"] >= 1:
+                self.stdout.write(f"[{n}/{len(videos)}] video {video.pk}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Resolved the metadata of {len(videos)} videos")
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from courses.imaging import generate_variants
+from courses.models import Image
+
+
+class Command(BaseCommand):
+    help = "Generate the missing variants of Image contents"
+
+    def handle(self, *args, **options):
+        images = Image.objects.only("file", "variants")
+        missing = [
+            image.pk
+            for image in images.iterator()
+            if image.file and image.variants.get("source") != image.file.name
+        ]
+        for n, pk in enumerate(missing, 1):
+            generate_variants(pk)
+            if options["verbosity"] >= 1:
+                self.stdout.write(f"[{n}/{len(missing)}] image {pk}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Generated the variants of {len(missing)} images")
+        )
@@ -0,0 +1,35 @@
+import sys
+from contextlib import ExitStack
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.transfer import TransferError, import_courses
+
+
+class Command(BaseCommand):
+    help = "Import courses from a JSON Lines export"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSON Lines file, - for stdin")
+        parser.add_argument("--owner", required=True, help="Username of the instructor")
+        parser.add_argument("--media", help="Tar file with the media files")
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user {options['owner']}")
+        try:
+            with ExitStack() as stack:
+                media = None
+                if options["media"]:
+                    media = stack.enter_context(open(options["media"], "rb"))
+                if options["path"] == "-":
+                    lines = sys.stdin
+                else:
+                    lines = stack.enter_context(open(options["path"], encoding="utf-8"))
+                course_ids = import_courses(lines, owner, media)
+        except TransferError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Imported {len(course_ids)} courses"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from courses.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index of courses, modules and texts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "course_ids",
+            nargs="*",
+            type=int,
+            help="Courses to index again, all of them by default",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = rebuild_index(options["course_ids"] or None)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} search entries"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from courses.cache import bump_catalog_version
+from courses.counters import recount_courses, recount_modules, recount_students
+from courses.models import Subject
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized course, module and student counters"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            subjects = recount_courses()
+            courses = recount_modules()
+            recount_students()
+        # every subject list may show other counts now
+        bump_catalog_version(*Subject.objects.values_list("pk", flat=True))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Recounted totals of {subjects} subjects and {courses} courses"
+            )
+        )
@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from courses.cache import prime_fragments
+from courses.catalog import (
+    get_course_modules,
+    get_courses,
+    get_module_contents,
+    get_popular,
+    get_subjects,
+)
+from courses.models import Content, Course, Subject
+
+
+# the getters used by the views fill the cache on a miss, so warming up
+# is reading everything once
+def warm_catalog():
+    subjects = get_subjects()
+    get_courses()
+    get_popular([subject["id"] for subject in subjects])
+
+
+def warm_subject(subject):
+    get_courses(subject)
+
+
+def warm_course(course):
+    # rendered fragments of every item, then the pages of every module
+    contents = Content.objects.filter(module__course=course).with_items()
+    prime_fragments([content.item for content in contents])
+    for module in get_course_modules(course):
+        get_module_contents(module["id"], module["contents_version"])
+
+
+class Command(BaseCommand):
+    help = "Fill the catalog, module and content caches ahead of traffic"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Number of threads warming the cache, 1 to run serially",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        tasks = [("catalog", warm_catalog, None)]
+        tasks += [(f"subject {s}", warm_subject, s) for s in Subject.objects.all()]
+        tasks += [
+            (f"course {c}", warm_course, c)
+            for c in Course.objects.only("title", "version")
+        ]
+        concurrency = max(options["concurrency"], 1)
+        if concurrency == 1:
+            for n, (label, task, arg) in enumerate(tasks, 1):
+                self.run(task, arg)
+                self.progress(n, len(tasks), label)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {
+                    executor.submit(self.run_in_thread, task, arg): label
+                    for label, task, arg in tasks
+                }
+                for n, future in enumerate(as_completed(futures), 1):
+                    future.result()
+                    self.progress(n, len(tasks), futures[future])
+        self.stdout.write(self.style.SUCCESS(f"Cache warmed in {len(tasks)} steps"))
+
+    def run(self, task, arg):
+        if arg is None:
+            task()
+        else:
+            task(arg)
+
+    def run_in_thread(self, task, arg):
+        try:
+            self.run(task, arg)
+        finally:
+            # every thread opens its own database connection
+            connections.close_all()
+
+    def progress(self, n, total, label):
+        if self.verbosity >= 1:
+            self.stdout.write(f"[{n}/{total}] {label}")
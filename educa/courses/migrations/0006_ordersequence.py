@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0005_course_total_modules_course_total_students_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=255, unique=True)),
+                ("last", models.IntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0006_ordersequence"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["-created", "-id"], name="courses_cou_created_6b44b3_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="subject",
+            index=models.Index(
+                fields=["title", "id"], name="courses_sub_title_b0e13b_idx"
+            ),
+        ),
+    ]
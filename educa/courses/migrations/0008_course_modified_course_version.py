@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0007_course_courses_cou_created_6b44b3_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="modified",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0008_course_modified_course_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="module",
+            name="contents_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0010_chunkedupload"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
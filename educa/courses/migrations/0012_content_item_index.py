@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("courses", "0011_image_variants"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="content",
+            index=models.Index(
+                fields=["content_type", "object_id"],
+                name="courses_con_content_440b54_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:24
+
+import courses.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0012_content_item_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="file",
+            name="file",
+            field=models.FileField(
+                db_index=True,
+                storage=courses.storage.ContentAddressedStorage(),
+                upload_to="files",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="image",
+            name="file",
+            field=models.FileField(
+                db_index=True,
+                storage=courses.storage.ContentAddressedStorage(),
+                upload_to="images",
+            ),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:27
+
+from django.db import migrations, models
+from embed_video.backends import EmbedVideoException, SoundCloudBackend, detect_backend
+from embed_video.templatetags.embed_video_tags import VideoNode
+
+
+# a copy of courses.embeds.parse_url() as of this migration: the metadata
+# found in the url itself, without network access
+def parse_url(url):
+    fields = {
+        "resolved_url": url,
+        "provider": "",
+        "video_id": "",
+        "embed_html": "",
+        "thumbnail_url": "",
+    }
+    try:
+        backend = detect_backend(url)
+    except EmbedVideoException:
+        return fields
+    fields["provider"] = type(backend).__name__.removesuffix("Backend").lower()
+    # the embed code of oEmbed providers needs a request
+    if not isinstance(backend, SoundCloudBackend):
+        try:
+            fields["video_id"] = backend.code
+            fields["embed_html"] = backend.get_embed_code(
+                *VideoNode.get_size("small")
+            ).strip()
+        except EmbedVideoException:
+            pass
+    return fields
+
+
+def resolve_videos(apps, schema_editor):
+    # only what the url gives, fetch_video_metadata fetches the thumbnails
+    Video = apps.get_model("courses", "Video")
+    for video in Video.objects.only("url").iterator():
+        Video.objects.filter(pk=video.pk).update(**parse_url(video.url))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0013_content_addressed_files"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="video",
+            name="embed_html",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="video",
+            name="provider",
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name="video",
+            name="resolved_url",
+            field=models.URLField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="video",
+            name="thumbnail_url",
+            field=models.URLField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name="video",
+            name="video_id",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(resolve_videos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,154 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# the text index as of this migration, see courses.search
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE courses_searchentry_fts USING fts5(
+        title, body, content='courses_searchentry', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER courses_searchentry_ai AFTER INSERT ON courses_searchentry BEGIN
+        INSERT INTO courses_searchentry_fts(rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER courses_searchentry_ad AFTER DELETE ON courses_searchentry BEGIN
+        INSERT INTO courses_searchentry_fts(courses_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER courses_searchentry_au AFTER UPDATE ON courses_searchentry BEGIN
+        INSERT INTO courses_searchentry_fts(courses_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO courses_searchentry_fts(rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS courses_searchentry_ai",
+    "DROP TRIGGER IF EXISTS courses_searchentry_ad",
+    "DROP TRIGGER IF EXISTS courses_searchentry_au",
+    "DROP TABLE IF EXISTS courses_searchentry_fts",
+]
+POSTGRES_SCHEMA = ["""
+    CREATE INDEX courses_searchentry_document ON courses_searchentry USING gin ((
+        setweight(to_tsvector('english', title), 'A') ||
+        setweight(to_tsvector('english', body), 'B')
+    ))
+    """]
+POSTGRES_DROP = ["DROP INDEX IF EXISTS courses_searchentry_document"]
+
+FILL_ENTRIES = [
+    """
+    INSERT INTO courses_searchentry (kind, object_id, course_id, title, body)
+    SELECT 'course', id, id, title, overview FROM courses_course
+    """,
+    """
+    INSERT INTO courses_searchentry
+        (kind, object_id, course_id, module_id, title, body)
+    SELECT 'module', id, course_id, id, title, description FROM courses_module
+    """,
+    """
+    INSERT INTO courses_searchentry
+        (kind, object_id, course_id, module_id, title, body)
+    SELECT 'text', c.id, m.course_id, c.module_id, t.title, t.content
+    FROM courses_content c
+    JOIN courses_module m ON m.id = c.module_id
+    JOIN courses_text t ON t.id = c.object_id
+    WHERE c.content_type_id = (
+        SELECT id FROM django_content_type
+        WHERE app_label = 'courses' AND model = 'text'
+    )
+    """,
+]
+
+
+class VendorRunSQL(migrations.RunSQL):
+    # RunSQL on the databases of a single vendor only
+    def __init__(self, vendor, *args, **kwargs):
+        self.vendor = vendor
+        super().__init__(*args, **kwargs)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0014_video_embed_metadata"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("course", "Course"),
+                            ("module", "Module"),
+                            ("text", "Text"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("object_id", models.PositiveIntegerField()),
+                ("title", models.CharField(max_length=250)),
+                ("body", models.TextField(blank=True)),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_entries",
+                        to="courses.course",
+                    ),
+                ),
+                (
+                    "module",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_entries",
+                        to="courses.module",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "search entries",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("kind", "object_id"), name="unique_search_entry"
+                    )
+                ],
+            },
+        ),
+        # the entries are inserted after the index, the triggers index them
+        VendorRunSQL("sqlite", SQLITE_SCHEMA, SQLITE_DROP),
+        VendorRunSQL("postgresql", POSTGRES_SCHEMA, POSTGRES_DROP),
+        migrations.RunSQL(FILL_ENTRIES, migrations.RunSQL.noop),
+    ]
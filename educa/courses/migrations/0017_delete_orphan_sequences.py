@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# the parents of the order sequences, by key prefix; see
+# courses.fields.OrderField.parent_key
+PARENTS = {
+    "courses.module.order:course_id=": "Course",
+    "courses.content.order:module_id=": "Module",
+}
+
+
+def delete_orphan_sequences(apps, schema_editor):
+    # sequences of the courses and modules deleted before their sequences
+    # were deleted with them
+    OrderSequence = apps.get_model("courses", "OrderSequence")
+    for prefix, model_name in PARENTS.items():
+        parents = {
+            str(pk)
+            for pk in apps.get_model("courses", model_name).objects.values_list(
+                "pk", flat=True
+            )
+        }
+        orphans = [
+            sequence.pk
+            for sequence in OrderSequence.objects.filter(key__startswith=prefix)
+            if sequence.key[len(prefix) :] not in parents
+        ]
+        OrderSequence.objects.filter(pk__in=orphans).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0016_storedfile"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_orphan_sequences, migrations.RunPython.noop),
+    ]
@@ -1,26 +1,71 @@
+import uuid
+
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.utils import timezone
 from .fields import OrderField
+from .storage import content_storage
+from .cache import prime_fragments
 
 # import to render content
 from django.template.loader import render_to_string
+from django.urls import reverse
 
 
 # Create your models here.
-class Subject(models.Model):
+class CountersMixin:
+    # denormalized counters and versions are only written with F() updates
+    # by courses.counters, never saved back from a stale instance; the
+    # post_save receivers updating them run in the transaction of the save
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class Subject(CountersMixin, models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
+    total_courses = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ["total_courses"]
 
     class Meta:
         ordering = ["title"]
+        indexes = [models.Index(fields=["title", "id"])]
 
     def __str__(self):
         return self.title
 
 
-class Course(models.Model):
+class CourseQuerySet(models.QuerySet):
+    def for_catalog(self):
+        # a single query joining subject and owner
+        return self.select_related("subject", "owner").only(
+            "title",
+            "slug",
+            "total_modules",
+            "subject__title",
+            "subject__slug",
+            "owner__first_name",
+            "owner__last_name",
+        )
+
+
+class Course(CountersMixin, models.Model):
     owner = models.ForeignKey(
         User, related_name="courses_created", on_delete=models.CASCADE
     )
@@ -32,19 +77,32 @@ class Course(models.Model):
     slug = models.SlugField(max_length=200, unique=True)
     overview = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
+    total_modules = models.PositiveIntegerField(default=0, editable=False)
+    total_students = models.PositiveIntegerField(default=0, editable=False)
+    # bumped on any change of the course, its contents or its students
+    version = models.PositiveIntegerField(default=0, editable=False)
+    modified = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = CourseQuerySet.as_manager()
+    counter_fields = ["total_modules", "total_students", "version", "modified"]
 
     class Meta:
         ordering = ["-created"]
+        indexes = [models.Index(fields=["-created", "-id"])]
 
     def __str__(self):
         return self.title
 
 
-class Module(models.Model):
+class Module(CountersMixin, models.Model):
     course = models.ForeignKey(Course, related_name="modules", on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     order = OrderField(blank=True, for_fields=["course"])
+    # bumped on any change of the contents of the module
+    contents_version = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ["contents_version"]
 
     class Meta:
         ordering = ["order"]
@@ -53,6 +111,21 @@ class Module(models.Model):
         return f"{self.order}. {self.title}"
 
 
+# last position handed out by an OrderField for each parent
+class OrderSequence(models.Model):
+    key = models.CharField(max_length=255, unique=True)
+    last = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.key} ({self.last})"
+
+
+class ContentQuerySet(models.QuerySet):
+    def with_items(self):
+        # resolve the generic items with one query per content type
+        return self.prefetch_related("item")
+
+
 class Content(models.Model):
     module = models.ForeignKey(
         Module, related_name="contents", on_delete=models.CASCADE
@@ -66,8 +139,12 @@ class Content(models.Model):
     item = GenericForeignKey("content_type", "object_id")
     order = OrderField(blank=True, for_fields=["module"])
 
+    objects = ContentQuerySet.as_manager()
+
     class Meta:
         ordering = ["order"]
+        # contents using an item
+        indexes = [models.Index(fields=["content_type", "object_id"])]
 
 
 # view to display/render course contnet as a string
@@ -79,7 +156,15 @@ class ItemBase(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    # rendered fragment, filled from the fragment store
+    _rendered = None
+
     def render(self):
+        if self._rendered is None:
+            prime_fragments([self])
+        return self._rendered
+
+    def render_template(self):
         return render_to_string(
             f"courses/content/{self._meta.model_name}.html", {"item": self}
         )
@@ -95,13 +180,119 @@ class Text(ItemBase):
     content = models.TextField()
 
 
-class File(ItemBase):
-    file = models.FileField(upload_to="files")
+class StoredFileItem(ItemBase):
+    # items whose file is shared with the items of the same content, see
+    # courses.storage
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # keep the lock the storage takes on the file until the row is saved
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class File(StoredFileItem):
+    file = models.FileField(upload_to="files", storage=content_storage, db_index=True)
+
 
+class Image(StoredFileItem):
+    file = models.FileField(upload_to="images", storage=content_storage, db_index=True)
+    # resized copies of the file, generated by courses.imaging
+    variants = models.JSONField(default=dict, blank=True, editable=False)
 
-class Image(ItemBase):
-    file = models.FileField(upload_to="images")
+    def variant_urls(self):
+        # only variants generated from the current file
+        if not self.file or self.variants.get("source") != self.file.name:
+            return {}
+        return {
+            name: default_storage.url(path)
+            for name, path in self.variants.get("files", {}).items()
+        }
 
 
 class Video(ItemBase):
     url = models.URLField()
+    # embed metadata of the url, resolved by courses.embeds
+    resolved_url = models.URLField(blank=True, editable=False)
+    provider = models.CharField(max_length=20, blank=True, editable=False)
+    video_id = models.CharField(max_length=100, blank=True, editable=False)
+    embed_html = models.TextField(blank=True, editable=False)
+    thumbnail_url = models.URLField(max_length=500, blank=True, editable=False)
+
+
+# a File or Image content uploaded in chunks, see courses.uploads
+class ChunkedUpload(models.Model):
+    MODEL_CHOICES = [("file", "File"), ("image", "Image")]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        User, related_name="chunked_uploads", on_delete=models.CASCADE
+    )
+    module = models.ForeignKey(
+        Module, related_name="chunked_uploads", on_delete=models.CASCADE
+    )
+    model_name = models.CharField(max_length=10, choices=MODEL_CHOICES)
+    title = models.CharField(max_length=250)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # bytes received so far
+    offset = models.PositiveBigIntegerField(default=0)
+    content = models.OneToOneField(
+        Content, null=True, blank=True, related_name="+", on_delete=models.SET_NULL
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+
+# a searchable text of the catalog, see courses.search; the text index
+# itself is maintained by the database
+class SearchEntry(models.Model):
+    KIND_CHOICES = [("course", "Course"), ("module", "Module"), ("text", "Text")]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # id of the course, the module or the content of the text
+    object_id = models.PositiveIntegerField()
+    course = models.ForeignKey(
+        Course, related_name="search_entries", on_delete=models.CASCADE
+    )
+    module = models.ForeignKey(
+        Module,
+        null=True,
+        blank=True,
+        related_name="search_entries",
+        on_delete=models.CASCADE,
+    )
+    title = models.CharField(max_length=250)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name_plural = "search entries"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "object_id"], name="unique_search_entry"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.title}"
+
+    def get_absolute_url(self):
+        if self.kind == "text":
+            return reverse(
+                "student_course_detail_module", args=[self.course_id, self.module_id]
+            )
+        return reverse("course_detail", args=[self.course.slug])
+
+
+# a file of the content-addressed storage, locked while the file is
+# written or released; see courses.storage
+class StoredFile(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,328 @@
+import re
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+
+from .models import Content, Course, Module, SearchEntry, Text
+
+# full-text search over the titles and descriptions of courses and modules
+# and over Text contents. Every searchable object has one SearchEntry row,
+# kept up to date by the signals; the inverted index on those rows is an
+# FTS5 table filled by triggers on SQLite and a GIN index on PostgreSQL,
+# created by migration 0015 and by create_index()
+TABLE = SearchEntry._meta.db_table
+FTS_TABLE = f"{TABLE}_fts"
+SEARCH_CONFIG = "english"
+# titles weigh more than bodies in the ranking
+TITLE_WEIGHT = 10.0
+MAX_TERMS = 8
+REBUILD_CHUNK_SIZE = 1000
+
+SQLITE_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, body, content='{TABLE}', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {TABLE}_ai AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {TABLE}_ad AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {TABLE}_au AFTER UPDATE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {TABLE}_{name}" for name in ("ai", "ad", "au")
+] + [f"DROP TABLE IF EXISTS {FTS_TABLE}"]
+
+# the queries repeat this expression so the planner uses the index
+POSTGRES_DOCUMENT = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', title), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', body), 'B')"
+)
+POSTGRES_SCHEMA = [
+    f"CREATE INDEX {TABLE}_document ON {TABLE} USING gin (({POSTGRES_DOCUMENT}))"
+]
+POSTGRES_DROP = [f"DROP INDEX IF EXISTS {TABLE}_document"]
+
+
+# the database objects of the index, see missing_index()
+SQLITE_OBJECTS = [FTS_TABLE, *(f"{TABLE}_{name}" for name in ("ai", "ad", "au"))]
+POSTGRES_OBJECTS = [f"{TABLE}_document"]
+
+
+def create_index(using=DEFAULT_DB_ALIAS):
+    vendor = connections[using].vendor
+    with connections[using].cursor() as cursor:
+        for sql in {"sqlite": SQLITE_SCHEMA, "postgresql": POSTGRES_SCHEMA}.get(
+            vendor, []
+        ):
+            cursor.execute(sql)
+        if vendor == "sqlite":
+            # index the entries already there
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_index(using=DEFAULT_DB_ALIAS):
+    vendor = connections[using].vendor
+    with connections[using].cursor() as cursor:
+        for sql in {"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP}.get(vendor, []):
+            cursor.execute(sql)
+
+
+def missing_index(using=DEFAULT_DB_ALIAS):
+    # the parts of the index missing from the database; SQLite rebuilds the
+    # table on an AlterField of SearchEntry, which drops its triggers
+    vendor = connections[using].vendor
+    if vendor == "sqlite":
+        sql = "SELECT name FROM sqlite_master WHERE name IN ({})"
+        expected = SQLITE_OBJECTS
+    elif vendor == "postgresql":
+        sql = "SELECT indexname FROM pg_indexes WHERE indexname IN ({})"
+        expected = POSTGRES_OBJECTS
+    else:
+        return []
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql.format(", ".join(["%s"] * len(expected))), expected)
+        found = {row[0] for row in cursor.fetchall()}
+    return [name for name in expected if name not in found]
+
+
+# indexing
+def course_entry(course):
+    return SearchEntry(
+        kind="course",
+        object_id=course.pk,
+        course_id=course.pk,
+        title=course.title,
+        body=course.overview,
+    )
+
+
+def module_entry(module):
+    return SearchEntry(
+        kind="module",
+        object_id=module.pk,
+        course_id=module.course_id,
+        module_id=module.pk,
+        title=module.title,
+        body=module.description,
+    )
+
+
+def text_entry(content, text):
+    return SearchEntry(
+        kind="text",
+        object_id=content.pk,
+        course_id=content.module.course_id,
+        module_id=content.module_id,
+        title=text.title,
+        body=text.content,
+    )
+
+
+def save_entry(entry):
+    fields = ("course_id", "module_id", "title", "body")
+    SearchEntry.objects.update_or_create(
+        kind=entry.kind,
+        object_id=entry.object_id,
+        defaults={name: getattr(entry, name) for name in fields},
+    )
+
+
+def index_course(course):
+    save_entry(course_entry(course))
+
+
+def index_module(module):
+    save_entry(module_entry(module))
+    # the contents follow a module moved to another course
+    SearchEntry.objects.filter(module=module).exclude(
+        course_id=module.course_id
+    ).update(course_id=module.course_id)
+
+
+def index_content(content):
+    if content.content_type_id != text_type().id:
+        return
+    text = Text.objects.filter(pk=content.object_id).first()
+    if text is not None:
+        save_entry(text_entry(content, text))
+
+
+def index_text(text):
+    SearchEntry.objects.filter(
+        kind="text", object_id__in=text_contents(text).values("id")
+    ).update(title=text.title, body=text.content)
+
+
+def unindex_content(content):
+    SearchEntry.objects.filter(kind="text", object_id=content.pk).delete()
+
+
+def unindex_text(text):
+    # the contents of a deleted text are left without an item
+    SearchEntry.objects.filter(
+        kind="text", object_id__in=text_contents(text).values("id")
+    ).delete()
+
+
+def text_type():
+    return ContentType.objects.get_for_model(Text)
+
+
+def text_contents(text):
+    return Content.objects.filter(content_type=text_type(), object_id=text.pk)
+
+
+def rebuild_index(course_ids=None):
+    # index every course, or the given ones, from scratch; returns the
+    # number of entries
+    if missing_index():
+        # the entries written since the index went missing are not in it
+        drop_index()
+        create_index()
+        course_ids = None
+    courses = Course.objects.order_by("pk")
+    modules = Module.objects.order_by("pk")
+    contents = Content.objects.filter(content_type=text_type()).order_by("pk")
+    entries = SearchEntry.objects.all()
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+        modules = modules.filter(course_id__in=course_ids)
+        contents = contents.filter(module__course_id__in=course_ids)
+        entries = entries.filter(course_id__in=course_ids)
+    entries.delete()
+    total = 0
+    for queryset, build in ((courses, course_entry), (modules, module_entry)):
+        for chunk in chunked(queryset.iterator(chunk_size=REBUILD_CHUNK_SIZE)):
+            SearchEntry.objects.bulk_create([build(obj) for obj in chunk])
+            total += len(chunk)
+    contents = contents.select_related("module").only("object_id", "module__course_id")
+    for chunk in chunked(contents.iterator(chunk_size=REBUILD_CHUNK_SIZE)):
+        texts = Text.objects.only("title", "content").in_bulk(
+            [content.object_id for content in chunk]
+        )
+        new = [
+            text_entry(content, texts[content.object_id])
+            for content in chunk
+            if content.object_id in texts
+        ]
+        SearchEntry.objects.bulk_create(new)
+        total += len(new)
+    if course_ids is None and connection.vendor == "sqlite":
+        # merge the segments written by the inserts
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def chunked(iterable, size=REBUILD_CHUNK_SIZE):
+    chunk = []
+    for obj in iterable:
+        chunk.append(obj)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# querying
+def get_terms(query):
+    # plain words only, the syntax of the engines is not exposed
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+class SearchResults:
+    # the ranked entries matching a query, as a lazy sequence for
+    # django.core.paginator.Paginator: counting and slicing run one query
+    # each, and only the rows of the page are loaded
+
+    def __init__(self, query):
+        self.terms = get_terms(query)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.fetch_count() if self.terms else 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError("SearchResults only support slicing")
+        offset = key.start or 0
+        if not self.terms or (key.stop is not None and key.stop <= offset):
+            return []
+        limit = -1 if key.stop is None else key.stop - offset
+        ids = self.fetch_ids(offset, limit)
+        entries = SearchEntry.objects.select_related("course", "module").in_bulk(ids)
+        return [entries[pk] for pk in ids if pk in entries]
+
+    def fetch_count(self):
+        if connection.vendor == "sqlite":
+            sql = f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        elif connection.vendor == "postgresql":
+            sql = (
+                f"SELECT count(*) FROM {TABLE} "
+                f"WHERE {POSTGRES_DOCUMENT} @@ to_tsquery('{SEARCH_CONFIG}', %s)"
+            )
+        else:
+            return self.fallback().count()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.match_expression()])
+            return cursor.fetchone()[0]
+
+    def fetch_ids(self, offset, limit):
+        if connection.vendor == "sqlite":
+            sql = (
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, {TITLE_WEIGHT}, 1.0), rowid "
+                "LIMIT %s OFFSET %s"
+            )
+        elif connection.vendor == "postgresql":
+            sql = (
+                f"SELECT id FROM {TABLE}, to_tsquery('{SEARCH_CONFIG}', %s) query "
+                f"WHERE {POSTGRES_DOCUMENT} @@ query "
+                f"ORDER BY ts_rank({POSTGRES_DOCUMENT}, query) DESC, id "
+                "LIMIT %s OFFSET %s"
+            )
+            limit = None if limit < 0 else limit
+        else:
+            ids = self.fallback().values_list("pk", flat=True)
+            return list(ids[offset:] if limit < 0 else ids[offset : offset + limit])
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.match_expression(), limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+    def match_expression(self):
+        # every term, as a prefix
+        if connection.vendor == "postgresql":
+            return " & ".join(f"{term}:*" for term in self.terms)
+        return " ".join(f'"{term}"*' for term in self.terms)
+
+    def fallback(self):
+        # no text index on other databases, a scan in a fixed order
+        condition = Q()
+        for term in self.terms:
+            condition &= Q(title__icontains=term) | Q(body__icontains=term)
+        return SearchEntry.objects.filter(condition).order_by("kind", "pk")
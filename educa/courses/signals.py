@@ -0,0 +1,313 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, search
+from .cache import (
+    bump_catalog_version,
+    bump_courses_version,
+    bump_popular_version,
+    delete_fragment,
+    store_fragments,
+)
+from .embeds import resolve_video, schedule_metadata
+from .enrollment import forget_enrollments
+from .imaging import delete_variants, schedule_variants
+from .storage import release_file
+from .models import (
+    ChunkedUpload,
+    Content,
+    Course,
+    File,
+    Image,
+    Module,
+    Subject,
+    Text,
+    Video,
+)
+from .uploads import delete_part
+
+ITEM_MODELS = (Text, Video, Image, File)
+
+
+# keep the rendered fragment of content items up to date
+def item_saved(sender, instance, **kwargs):
+    store_fragments([instance])
+
+
+def item_deleted(sender, instance, **kwargs):
+    delete_fragment(instance)
+
+
+for model in ITEM_MODELS:
+    post_save.connect(item_saved, sender=model)
+    post_delete.connect(item_deleted, sender=model)
+
+
+# release the stored files of File and Image items, shared between the
+# items with the same content
+def file_item_saving(sender, instance, **kwargs):
+    instance._previous_file = (
+        sender.objects.filter(pk=instance.pk).values_list("file", flat=True).first()
+        if instance.pk
+        else None
+    )
+
+
+def file_item_saved(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_file", None)
+    if previous and previous != instance.file.name:
+        release_file(previous)
+
+
+def file_item_deleted(sender, instance, **kwargs):
+    release_file(instance.file.name)
+
+
+for model in (File, Image):
+    pre_save.connect(file_item_saving, sender=model)
+    post_save.connect(file_item_saved, sender=model)
+    post_delete.connect(file_item_deleted, sender=model)
+
+
+# generate the variants of images in the background
+@receiver(post_save, sender=Image)
+def image_saved(sender, instance, **kwargs):
+    if instance.file and instance.variants.get("source") != instance.file.name:
+        transaction.on_commit(lambda: schedule_variants([instance.pk]))
+
+
+@receiver(post_delete, sender=Image)
+def image_deleted(sender, instance, **kwargs):
+    variants = instance.variants
+    transaction.on_commit(lambda: delete_variants(variants))
+
+
+# resolve the embed metadata of videos when their url changes, the parts
+# needing the network are fetched in the background
+@receiver(pre_save, sender=Video)
+def video_saving(sender, instance, **kwargs):
+    instance._fetch_metadata = instance.url != instance.resolved_url and resolve_video(
+        instance
+    )
+
+
+@receiver(post_save, sender=Video)
+def video_saved(sender, instance, **kwargs):
+    if instance._fetch_metadata:
+        transaction.on_commit(lambda: schedule_metadata([instance.pk]))
+
+
+# keep the search index up to date; entries of deleted courses and modules
+# go with them
+@receiver(post_save, sender=Course)
+def search_course_saved(sender, instance, **kwargs):
+    search.index_course(instance)
+
+
+@receiver(post_save, sender=Module)
+def search_module_saved(sender, instance, **kwargs):
+    search.index_module(instance)
+
+
+@receiver(post_save, sender=Content)
+def search_content_saved(sender, instance, **kwargs):
+    search.index_content(instance)
+
+
+@receiver(post_delete, sender=Content)
+def search_content_deleted(sender, instance, **kwargs):
+    search.unindex_content(instance)
+
+
+@receiver(post_save, sender=Text)
+def search_text_saved(sender, instance, **kwargs):
+    search.index_text(instance)
+
+
+@receiver(post_delete, sender=Text)
+def search_text_deleted(sender, instance, **kwargs):
+    search.unindex_text(instance)
+
+
+# maintain the denormalized counters; these receivers are connected
+# before the catalog ones so the catalog is rebuilt with fresh counts
+@receiver(pre_save, sender=Course)
+def course_saving(sender, instance, **kwargs):
+    # remember the previous subject to move the course between subjects
+    instance._previous_subject_id = (
+        Course.objects.filter(pk=instance.pk)
+        .values_list("subject_id", flat=True)
+        .first()
+        if instance.pk
+        else None
+    )
+
+
+@receiver(post_save, sender=Course)
+def count_course_saved(sender, instance, created, **kwargs):
+    previous_subject_id = getattr(instance, "_previous_subject_id", None)
+    if created:
+        counters.add_courses(instance.subject_id, 1)
+    elif previous_subject_id and previous_subject_id != instance.subject_id:
+        counters.move_course(previous_subject_id, instance.subject_id)
+
+
+@receiver(post_delete, sender=Course)
+def count_course_deleted(sender, instance, **kwargs):
+    counters.add_courses(instance.subject_id, -1)
+
+
+@receiver(post_save, sender=Module)
+def count_module_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.add_modules(instance.course_id, 1)
+
+
+@receiver(post_delete, sender=Module)
+def count_module_deleted(sender, instance, **kwargs):
+    counters.add_modules(instance.course_id, -1)
+
+
+def changed_course_ids(instance, action, reverse, pk_set):
+    # courses affected by a change of Course.students
+    if not reverse:
+        return [instance.pk]
+    if action == "post_clear":
+        return instance._cleared_course_ids
+    return list(pk_set)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def count_students_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # the courses of a user are not known anymore after the clear
+        instance._cleared_course_ids = list(
+            instance.courses_joined.values_list("id", flat=True)
+        )
+    elif action in ("post_add", "post_remove", "post_clear"):
+        counters.recount_students(changed_course_ids(instance, action, reverse, pk_set))
+
+
+# drop the order sequences of deleted parents, see courses.fields
+@receiver(post_delete, sender=Course)
+def course_sequence_deleted(sender, instance, **kwargs):
+    Module._meta.get_field("order").delete_sequence(course_id=instance.pk)
+
+
+@receiver(post_delete, sender=Module)
+def module_sequence_deleted(sender, instance, **kwargs):
+    Content._meta.get_field("order").delete_sequence(module_id=instance.pk)
+
+
+# invalidate the cached public catalog once the change is committed, so
+# no request caches the rows from before it
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def subject_changed(sender, instance, **kwargs):
+    subject_id = instance.id
+    transaction.on_commit(lambda: bump_catalog_version(subject_id))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    subject_ids = (instance.subject_id, getattr(instance, "_previous_subject_id", None))
+    transaction.on_commit(lambda: bump_catalog_version(*subject_ids))
+
+
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+def module_changed(sender, instance, **kwargs):
+    subject_id = (
+        Course.objects.filter(pk=instance.course_id)
+        .values_list("subject_id", flat=True)
+        .first()
+    )
+    transaction.on_commit(lambda: bump_catalog_version(subject_id))
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def students_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # enrollments change the popular courses of the subject
+    if action in ("post_add", "post_remove", "post_clear"):
+        course_ids = changed_course_ids(instance, action, reverse, pk_set)
+        subject_ids = list(
+            Course.objects.filter(pk__in=course_ids)
+            .values_list("subject_id", flat=True)
+            .distinct()
+        )
+        transaction.on_commit(lambda: bump_popular_version(*subject_ids))
+
+
+# bump the version of the courses behind a change, used for conditional
+# requests on the API
+@receiver(post_save, sender=Course)
+def course_version_changed(sender, instance, **kwargs):
+    counters.bump_course_version(pk=instance.pk)
+
+
+@receiver(post_delete, sender=Course)
+def course_version_deleted(sender, instance, **kwargs):
+    transaction.on_commit(bump_courses_version)
+
+
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+def module_version_changed(sender, instance, **kwargs):
+    counters.bump_course_version(pk=instance.course_id)
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def content_version_changed(sender, instance, **kwargs):
+    counters.bump_contents_version(pk=instance.module_id)
+    counters.bump_course_version(modules=instance.module_id)
+
+
+def item_version_changed(sender, instance, **kwargs):
+    content_type = ContentType.objects.get_for_model(instance)
+    counters.bump_contents_version(
+        contents__content_type=content_type, contents__object_id=instance.pk
+    )
+    counters.bump_course_version(
+        modules__contents__content_type=content_type,
+        modules__contents__object_id=instance.pk,
+    )
+
+
+for model in ITEM_MODELS:
+    post_save.connect(item_version_changed, sender=model)
+    post_delete.connect(item_version_changed, sender=model)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def students_version_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        counters.bump_course_version(
+            pk__in=changed_course_ids(instance, action, reverse, pk_set)
+        )
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def enrollments_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # invalidate the enrolled course ids of the users involved
+    if action == "pre_clear" and not reverse:
+        instance._cleared_user_ids = list(
+            instance.students.values_list("id", flat=True)
+        )
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if reverse:
+            user_ids = [instance.pk]
+        elif action == "post_clear":
+            user_ids = instance._cleared_user_ids
+        else:
+            user_ids = pk_set
+        forget_enrollments(user_ids)
+
+
+@receiver(post_delete, sender=ChunkedUpload)
+def upload_deleted(sender, instance, **kwargs):
+    # the part file of an abandoned upload
+    delete_part(instance)
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.apps import apps
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.utils.deconstruct import deconstructible
+
+HASH_BLOCK_SIZE = 1024 * 1024
+CONTENT_NAME_RE = re.compile(r"/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}(\.\w+)?$")
+
+
+@deconstructible(path="courses.storage.ContentAddressedStorage")
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage keeping a single copy of every distinct content.
+
+    Files are hashed while they are written and stored as
+    <upload_to>/<aa>/<bb>/<sha256><extension>; saving a content that is
+    already stored returns the name of the existing copy. Files are shared
+    between rows, use release_file() instead of deleting them.
+
+    The lowercased extension is part of the name so files keep their type;
+    the same bytes uploaded as .jpg and .jpeg are stored twice.
+
+    A file is written and released under a lock on its StoredFile row.
+    Saves must run in the transaction that writes the row pointing at the
+    file (see StoredFileItem.save()), so a release never deletes a file
+    that a concurrent save is about to reference.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # the name is derived from the content in _save()
+        return name
+
+    def _save(self, name, content):
+        match = CONTENT_NAME_RE.search(name)
+        # a name that is already stored, e.g. from an export, is saved
+        # again below its upload_to directory
+        directory = name[: match.start()] if match else posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        os.makedirs(self.path(directory), exist_ok=True)
+        digest = hashlib.sha256()
+        if hasattr(content, "temporary_file_path"):
+            # already on disk, hash it and move it into place
+            temporary_path = content.temporary_file_path()
+            with open(temporary_path, "rb") as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                    digest.update(block)
+        else:
+            fd, temporary_path = tempfile.mkstemp(
+                dir=self.path(directory), suffix=".part"
+            )
+            with os.fdopen(fd, "wb") as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+                    digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        name = posixpath.join(
+            directory, hexdigest[:2], hexdigest[2:4], hexdigest + extension
+        )
+        path = self.path(name)
+        with transaction.atomic():
+            lock_file(name)
+            if os.path.exists(path):
+                # already stored; temporary uploads are removed by their owner
+                if not hasattr(content, "temporary_file_path"):
+                    os.remove(temporary_path)
+                return name
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            file_move_safe(temporary_path, path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        return name
+
+
+content_storage = ContentAddressedStorage()
+
+
+def is_content_addressed(name):
+    return CONTENT_NAME_RE.search(name) is not None
+
+
+def lock_file(name):
+    # lock the StoredFile row of a name until the end of the transaction
+    StoredFile = apps.get_model("courses", "StoredFile")
+    StoredFile.objects.get_or_create(name=name)
+    return StoredFile.objects.select_for_update().get(name=name)
+
+
+def file_fields():
+    # every model field keeping its files in a content-addressed storage
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField) and isinstance(
+                field.storage, ContentAddressedStorage
+            ):
+                yield model, field
+
+
+def is_referenced(name):
+    return any(
+        model._default_manager.filter(**{field.attname: name}).exists()
+        for model, field in file_fields()
+    )
+
+
+def discard_file(name):
+    # delete a stored file if no row points at it, returns whether it was
+    if not name:
+        return False
+    with transaction.atomic():
+        stored = lock_file(name)
+        if is_referenced(name):
+            return False
+        content_storage.delete(name)
+        stored.delete()
+    return True
+
+
+def release_file(name):
+    # delete a stored file once the change is committed, if no row of any
+    # model points at it anymore
+    transaction.on_commit(lambda: discard_file(name))
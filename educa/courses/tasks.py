@@ -0,0 +1,58 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# a small in-process pool for the work done after a save, such as image
+# variants and video metadata
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                thread_name_prefix="courses",
+            )
+        return _executor
+
+
+def run_in_background(func, *args):
+    # with no workers configured the job runs right away
+    if getattr(settings, "BACKGROUND_WORKERS", 0):
+        get_executor().submit(run_in_worker, func, *args)
+    else:
+        func(*args)
+
+
+def run_in_worker(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Background job %s%r failed", func.__name__, args)
+    finally:
+        # every worker thread opens its own database connection
+        connections.close_all()
+
+
+def save_if_unchanged(model, pk, fields, **unchanged):
+    # store the result of a job on an item, unless the values the job
+    # worked from ("unchanged") were changed in the meantime; returns the
+    # previous values of the fields, None when nothing was saved
+    with transaction.atomic():
+        item = model.objects.select_for_update().filter(pk=pk, **unchanged).first()
+        if item is None:
+            return None
+        previous = {name: getattr(item, name) for name in fields}
+        for name, value in fields.items():
+            setattr(item, name, value)
+        # the save re-renders the stored fragment of the item
+        item.save(update_fields=[*fields, "updated"])
+    return previous
@@ -0,0 +1,42 @@
+import base64
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+
+from .models import Course, Module, Subject
+
+# the tests run without a Redis server
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+def basic_auth(username, password="secret"):
+    # credentials for the API actions using BasicAuthentication
+    credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+    return {"HTTP_AUTHORIZATION": f"Basic {credentials}"}
+
+
+class CourseFixtureMixin:
+    # an empty cache, temporary MEDIA_ROOT and UPLOAD_ROOT directories and
+    # an instructor owning a course with one module
+    module_title = "Module"
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        media_root, upload_root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.addCleanup(shutil.rmtree, upload_root)
+        self.enterContext(
+            override_settings(MEDIA_ROOT=media_root, UPLOAD_ROOT=upload_root)
+        )
+        self.owner = User.objects.create_user(username="owner", password="secret")
+        self.subject = Subject.objects.create(title="Mathematics", slug="mathematics")
+        self.course = Course.objects.create(
+            owner=self.owner, subject=self.subject, title="Algebra", slug="algebra"
+        )
+        self.module = Module.objects.create(course=self.course, title=self.module_title)
@@ -1,3 +1,1316 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.signals import request_started
+from django.db import DatabaseError, connection
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from . import enrollment, search
+from .cache import (
+    get_catalog_rows,
+    get_catalog_versions,
+    item_fragment_key,
+    popular_scope,
+    prime_fragments,
+)
+from .cache_backends import TieredCache
+from .checks import check_search_index
+from .downloads import serve_public_media
+from .enrollment import get_enrolled_course_ids, is_enrolled
+from .fields import bulk_create_ordered
+from .models import (
+    ChunkedUpload,
+    Content,
+    Course,
+    Image,
+    File,
+    Module,
+    OrderSequence,
+    SearchEntry,
+    StoredFile,
+    Subject,
+    Text,
+    Video,
+)
+from .testing import LOCMEM_CACHES, CourseFixtureMixin, basic_auth
+from .transfer import export_lines, export_media
+from .uploads import OffsetMismatch, part_path, write_chunk
 
 # Create your tests here.
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CourseListQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subject = Subject.objects.create(title="Mathematics", slug="mathematics")
+
+    def add_courses(self, count):
+        for _ in range(count):
+            n = Course.objects.count()
+            owner = User.objects.create(
+                username=f"owner{n}", first_name="Owner", last_name=str(n)
+            )
+            Course.objects.create(
+                owner=owner,
+                subject=self.subject,
+                title=f"Course {n}",
+                slug=f"course-{n}",
+                overview="Overview",
+            )
+
+    def assertCatalogQueries(self, url, num):
+        # always measure with a cold catalog cache
+        cache.clear()
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_course_list_query_count_is_constant(self):
+        url = reverse("course_list")
+        self.add_courses(1)
+        self.assertCatalogQueries(url, 2)
+        self.add_courses(20)
+        response = self.assertCatalogQueries(url, 2)
+        self.assertContains(response, "Owner 20")
+
+    def test_subject_course_list_query_count_is_constant(self):
+        url = reverse("course_list_subject", args=[self.subject.slug])
+        self.add_courses(1)
+        self.assertCatalogQueries(url, 3)
+        self.add_courses(20)
+        self.assertCatalogQueries(url, 3)
+
+    def test_warm_cache(self):
+        self.add_courses(3)
+        cache.clear()
+        out = StringIO()
+        call_command("warm_cache", concurrency=1, stdout=out)
+        self.assertIn("[5/5] course Course 0", out.getvalue())
+        # only the subject lookup is left
+        with self.assertNumQueries(0):
+            self.client.get(reverse("course_list"))
+        with self.assertNumQueries(1):
+            self.client.get(reverse("course_list_subject", args=[self.subject.slug]))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CourseApiTests(CourseFixtureMixin, TestCase):
+    def assertNotModified(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+
+    def test_course_list_conditional(self):
+        url = reverse("api:course-list")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotModified(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.module.title = "Renamed"
+            self.module.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Renamed")
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        # a delete moves Last-Modified too, not only the ETag
+        later = time.time_ns() + 2 * 10**9
+        with mock.patch("courses.cache.time.time_ns", return_value=later):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.course.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 0)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_detail_conditional(self):
+        url = reverse("api:course-detail", args=[self.course.pk])
+        etag = self.client.get(url)["ETag"]
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+        self.course.overview = "Changed"
+        self.course.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["overview"], "Changed")
+
+    def add_texts(self, module, count):
+        for n in range(count):
+            text = Text.objects.create(
+                owner=self.owner, title=f"Text {n}", content=f"Body {n}"
+            )
+            Content.objects.create(module=module, item=text)
+
+    def test_contents_query_count_is_constant(self):
+        url = reverse("api:course-contents", args=[self.course.pk])
+        self.course.students.add(self.owner)
+        self.add_texts(self.module, 1)
+        # user, course check, enrollment, course, modules, contents, texts
+        with self.assertNumQueries(7):
+            self.client.get(url, **basic_auth("owner"))
+        for n in range(5):
+            module = Module.objects.create(course=self.course, title=f"Module {n}")
+            self.add_texts(module, 10)
+        cache.clear()
+        with self.assertNumQueries(7):
+            response = self.client.get(url, **basic_auth("owner"))
+        self.assertEqual(len(response.json()["modules"]), 6)
+
+    def test_contents_missing_item(self):
+        self.course.students.add(self.owner)
+        self.add_texts(self.module, 2)
+        Text.objects.filter(title="Text 0").delete()
+        response = self.client.get(
+            reverse("api:course-contents", args=[self.course.pk]),
+            **basic_auth("owner"),
+        )
+        self.assertEqual(response.status_code, 200)
+        contents = response.json()["modules"][0]["contents"]
+        self.assertIsNone(contents[0]["item"])
+        self.assertIn("Body 1", contents[1]["item"])
+
+    def bulk_enroll(self, data, username="student"):
+        return self.client.post(
+            reverse("api:course-bulk-enroll"),
+            data,
+            content_type="application/json",
+            **basic_auth(username),
+        )
+
+    def test_bulk_enroll(self):
+        student = User.objects.create_user(username="student", password="secret")
+        other = Course.objects.create(
+            owner=self.owner, subject=self.subject, title="Geometry", slug="geometry"
+        )
+        data = {"courses": [self.course.pk, other.pk, self.course.pk, 999]}
+        response = self.bulk_enroll(data)
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {"id": self.course.pk, "enrolled": 1, "already_enrolled": 0},
+                {"id": other.pk, "enrolled": 1, "already_enrolled": 0},
+                {"id": 999, "error": "Not found."},
+            ],
+        )
+        # enrolling again changes nothing
+        response = self.bulk_enroll(data)
+        self.assertEqual(response.json()["results"][0]["already_enrolled"], 1)
+        self.assertEqual(student.courses_joined.count(), 2)
+
+    def test_bulk_enroll_other_users(self):
+        student = User.objects.create_user(username="student", password="secret")
+        User.objects.create_user(username="admin", password="secret", is_staff=True)
+        data = {"courses": [self.course.pk], "users": [self.owner.pk, student.pk]}
+        self.assertEqual(self.bulk_enroll(data).status_code, 403)
+        # unknown users are reported, nobody gets enrolled
+        response = self.bulk_enroll({**data, "users": [student.pk, 999]}, "admin")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("999", response.json()["users"][0])
+        self.assertFalse(self.course.students.exists())
+
+        self.assertEqual(get_enrolled_course_ids(student), frozenset())
+        scope = popular_scope(self.subject.pk)
+        version = get_catalog_versions([scope])[scope]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.bulk_enroll(data, "admin")
+        self.assertEqual(response.json()["results"][0]["enrolled"], 2)
+        # the side effects of Course.students.add()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.total_students, 2)
+        student = User.objects.get(pk=student.pk)
+        self.assertEqual(get_enrolled_course_ids(student), {self.course.pk})
+        self.assertNotEqual(get_catalog_versions([scope])[scope], version)
+
+    def test_bulk_enroll_malformed(self):
+        User.objects.create_user(username="student", password="secret")
+        for data in ([self.course.pk], {"courses": self.course.pk}, {}):
+            self.assertEqual(self.bulk_enroll(data).status_code, 400)
+        response = self.client.post(
+            reverse("api:course-bulk-enroll"), {"courses": [self.course.pk]}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_popular_courses(self):
+        students = [User.objects.create_user(username=f"s{n}") for n in range(3)]
+        courses = [self.course] + [
+            Course.objects.create(
+                owner=self.owner, subject=self.subject, title=title, slug=title
+            )
+            for title in ("Geometry", "Calculus", "Topology")
+        ]
+        for course, total in zip(courses, (1, 3, 0, 2)):
+            course.students.add(*students[:total])
+        url = reverse("api:subject-list")
+
+        def popular():
+            return self.client.get(url).json()["results"][0]["popular_courses"]
+
+        # the most enrolled first
+        self.assertEqual(popular(), ["Geometry (3)", "Topology (2)", "Algebra (1)"])
+        versions = get_catalog_versions(["all", self.subject.pk])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.course.students.add(*students)
+            # still cached until the enrollments are committed
+            self.assertEqual(
+                popular(), ["Geometry (3)", "Topology (2)", "Algebra (1)"]
+            )
+        self.assertTrue(callbacks)
+        self.assertEqual(popular(), ["Algebra (3)", "Geometry (3)", "Topology (2)"])
+        # the course lists do not show the enrollments
+        self.assertEqual(get_catalog_versions(["all", self.subject.pk]), versions)
+
+    def add_courses(self, count):
+        for n in range(count):
+            Course.objects.create(
+                owner=self.owner,
+                subject=self.subject,
+                title=f"Course {n}",
+                slug=f"course-{n}",
+            )
+
+    def follow(self, url, link):
+        # the pages from url on, following the next or previous links
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([course["id"] for course in data["results"]])
+            url = data[link]
+        return pages
+
+    def test_page_number_pagination_by_default(self):
+        self.add_courses(11)
+        data = self.client.get(reverse("api:course-list")).json()
+        self.assertEqual(data["count"], 12)
+        self.assertEqual(len(data["results"]), 10)
+        self.assertIn("page=2", data["next"])
+
+    def test_keyset_pagination(self):
+        self.add_courses(6)
+        # rows sharing "created" are told apart by the id
+        Course.objects.filter(title__in=["Course 1", "Course 2", "Course 3"]).update(
+            created=self.course.created
+        )
+        expected = list(
+            Course.objects.order_by("-created", "-id").values_list("id", flat=True)
+        )
+        url = reverse("api:course-list") + "?pagination=cursor&page_size=3"
+        data = self.client.get(url).json()
+        self.assertNotIn("count", data)
+        self.assertIsNone(data["previous"])
+
+        pages = self.follow(url, "next")
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        # and back from the last page to the first
+        last = self.client.get(url).json()["next"]
+        last = self.client.get(last).json()["next"]
+        self.assertEqual(self.follow(last, "previous"), pages[::-1])
+
+    def test_malformed_cursor(self):
+        url = reverse("api:course-list")
+
+        def cursor(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+        for value in (
+            "not base64!",
+            base64.urlsafe_b64encode(b"\xff").decode(),
+            cursor([1, 2]),
+            cursor({"values": ["yesterday", 1]}),
+            cursor({"values": [None, 1]}),
+            cursor({"values": ["2024-01-01T00:00:00Z"]}),
+        ):
+            with self.subTest(value=value):
+                response = self.client.get(url, {"cursor": value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("cursor", response.json())
+
+    def test_malformed_pk(self):
+        response = self.client.get(reverse("api:course-detail", args=["abc"]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse("api:course-contents", args=["abc"]), **basic_auth("owner")
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogRowsTests(SimpleTestCase):
+    key = "catalog:test"
+
+    def setUp(self):
+        cache.clear()
+        self.compute = mock.Mock(side_effect=lambda: [self.compute.call_count])
+
+    def get_rows(self, version=1):
+        return get_catalog_rows(self.key, version, self.compute)
+
+    def test_refreshed_after_a_bump(self):
+        self.assertEqual(self.get_rows(), [1])
+        self.assertEqual(self.get_rows(), [1])
+        self.assertEqual(self.get_rows(version=2), [2])
+        self.assertEqual(self.compute.call_count, 2)
+        self.assertIsNone(cache.get(f"{self.key}:lock"))
+
+    def test_stale_rows_served_while_recomputed(self):
+        self.get_rows()
+        # another worker is recomputing the rows of the new version
+        cache.add(f"{self.key}:lock", True)
+        self.assertEqual(self.get_rows(version=2), [1])
+        self.assertEqual(self.compute.call_count, 1)
+
+    @mock.patch("courses.cache.CATALOG_WAIT_INTERVAL", 0.01)
+    def test_waits_for_the_first_rows(self):
+        cache.add(f"{self.key}:lock", True)
+        # the worker holding the lock stores its rows a little later
+        timer = threading.Timer(
+            0.05, cache.set, [self.key, (1, time.time() + 60, ["first"])]
+        )
+        timer.start()
+        self.addCleanup(timer.join)
+        self.assertEqual(self.get_rows(), ["first"])
+        self.compute.assert_not_called()
+
+    @mock.patch("courses.cache.CATALOG_WAIT_TIMEOUT", 0.05)
+    @mock.patch("courses.cache.CATALOG_WAIT_INTERVAL", 0.01)
+    def test_computes_when_waiting_fails(self):
+        cache.add(f"{self.key}:lock", True)
+        self.assertEqual(self.get_rows(), [1])
+        # the lock of the other worker is left alone
+        self.assertTrue(cache.get(f"{self.key}:lock"))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FragmentStoreTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for n in range(3):
+            Text.objects.create(
+                owner=self.owner, title=f"Text {n}", content=f"Body {n}"
+            )
+
+    def test_stored_on_save(self):
+        texts = list(Text.objects.order_by("pk"))
+        with (
+            mock.patch.object(Text, "render_template", side_effect=AssertionError),
+            mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many,
+            self.assertNumQueries(0),
+        ):
+            prime_fragments(texts)
+            self.assertEqual(get_many.call_count, 1)
+            self.assertIn("Body 2", texts[2].render())
+
+    def test_rendered_again_when_updated(self):
+        text = Text.objects.first()
+        # an update() sends no signal, the stored fragment is outdated
+        Text.objects.filter(pk=text.pk).update(
+            content="Changed", updated=timezone.now() + timedelta(seconds=1)
+        )
+        self.assertIn("Changed", Text.objects.get(pk=text.pk).render())
+        # and stored again
+        with mock.patch.object(Text, "render_template", side_effect=AssertionError):
+            self.assertIn("Changed", Text.objects.get(pk=text.pk).render())
+
+    def test_missing_fragments(self):
+        text = Text.objects.first()
+        key = item_fragment_key(text)
+        self.assertIsNotNone(cache.get(key))
+        text.delete()
+        self.assertIsNone(cache.get(key))
+        cache.clear()
+        texts = list(Text.objects.all())
+        prime_fragments(texts)
+        self.assertEqual(len(cache.get_many(map(item_fragment_key, texts))), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CounterTests(CourseFixtureMixin, TestCase):
+    def assertTotals(self, courses, modules, students):
+        self.subject.refresh_from_db()
+        self.course.refresh_from_db()
+        totals = (
+            self.subject.total_courses,
+            self.course.total_modules,
+            self.course.total_students,
+        )
+        self.assertEqual(totals, (courses, modules, students))
+
+    def test_courses_and_modules(self):
+        self.assertTotals(courses=1, modules=1, students=0)
+        Module.objects.create(course=self.course, title="Second")
+        self.assertTotals(courses=1, modules=2, students=0)
+        self.module.delete()
+        self.assertTotals(courses=1, modules=1, students=0)
+
+        other = Subject.objects.create(title="Physics", slug="physics")
+        self.course.subject = other
+        self.course.save()
+        other.refresh_from_db()
+        self.assertEqual(other.total_courses, 1)
+        self.assertTotals(courses=0, modules=1, students=0)
+        self.course.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.total_courses, 0)
+
+    def test_counters_roll_back_with_the_row(self):
+        with mock.patch("courses.counters.add_modules", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                Module.objects.create(course=self.course, title="Second")
+        # the module is not saved without its count
+        self.assertEqual(self.course.modules.count(), 1)
+        self.assertTotals(courses=1, modules=1, students=0)
+
+    def test_students(self):
+        student = User.objects.create_user(username="student")
+        other = Course.objects.create(
+            owner=self.owner, subject=self.subject, title="Geometry", slug="geometry"
+        )
+        self.course.students.add(student, self.owner)
+        self.assertTotals(courses=2, modules=1, students=2)
+        self.course.students.remove(self.owner)
+        self.assertTotals(courses=2, modules=1, students=1)
+        self.course.students.clear()
+        self.assertTotals(courses=2, modules=1, students=0)
+
+        # the same changes from the side of the user
+        student.courses_joined.add(self.course, other)
+        self.assertTotals(courses=2, modules=1, students=1)
+        student.courses_joined.remove(other)
+        other.refresh_from_db()
+        self.assertEqual(other.total_students, 0)
+        student.courses_joined.add(other)
+        student.courses_joined.clear()
+        other.refresh_from_db()
+        self.assertEqual(other.total_students, 0)
+        self.assertTotals(courses=2, modules=1, students=0)
+
+    def test_recount_totals(self):
+        self.course.students.add(self.owner)
+        Course.objects.update(total_modules=5, total_students=5)
+        Subject.objects.update(total_courses=5)
+        other = Subject.objects.create(title="Physics", slug="physics")
+        versions = get_catalog_versions([self.subject.pk, other.pk])
+        call_command("recount_totals", stdout=StringIO())
+        self.assertTotals(courses=1, modules=1, students=1)
+        # the catalog of every subject is rebuilt
+        bumped = get_catalog_versions([self.subject.pk, other.pk])
+        self.assertNotEqual(bumped[self.subject.pk], versions[self.subject.pk])
+        self.assertNotEqual(bumped[other.pk], versions[other.pk])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EnrollmentCacheTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.student = User.objects.create_user(username="student")
+
+    def enrolled(self):
+        # a fresh user object, as in a new request
+        return get_enrolled_course_ids(User.objects.get(pk=self.student.pk))
+
+    def enroll(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.add(self.student)
+
+    def test_enrolled_course_ids(self):
+        self.assertEqual(self.enrolled(), frozenset())
+        student = User.objects.get(pk=self.student.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(is_enrolled(student, self.course.pk))
+        self.enroll()
+        self.assertEqual(self.enrolled(), {self.course.pk})
+        self.assertFalse(is_enrolled(self.student, "abc"))
+        self.assertEqual(get_enrolled_course_ids(AnonymousUser()), frozenset())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.courses_joined.clear()
+        self.assertEqual(self.enrolled(), frozenset())
+
+    def test_set_loaded_before_a_change(self):
+        load = enrollment.load_enrolled_course_ids
+
+        def load_before_enrollment(user_id):
+            # the enrollment commits while the old set is being loaded
+            course_ids = load(user_id)
+            self.enroll()
+            return course_ids
+
+        with mock.patch(
+            "courses.enrollment.load_enrolled_course_ids",
+            side_effect=load_before_enrollment,
+        ):
+            self.assertEqual(self.enrolled(), frozenset())
+        # the set stored late is not read by the next requests
+        self.assertEqual(self.enrolled(), {self.course.pk})
+
+
+class TieredCacheTests(SimpleTestCase):
+    def make_cache(self, process, **options):
+        # caches with different locations behave like separate processes
+        # sharing the same locmem L2
+        options.setdefault("SYNC_INTERVAL", 60)
+        tiered = TieredCache(
+            f"{self.id()}:{process}",
+            {
+                "OPTIONS": {
+                    "L2": {
+                        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                        "LOCATION": self.id(),
+                    },
+                    **options,
+                }
+            },
+        )
+        self.addCleanup(tiered.shared.clear)
+        return tiered
+
+    def test_hits_and_misses(self):
+        first, second = self.make_cache("first"), self.make_cache("second")
+        self.assertIsNone(first.get("subjects"))
+        first.set("subjects", ["Mathematics"])
+        self.assertEqual(second.get("subjects"), ["Mathematics"])
+        self.assertEqual(second.get("subjects"), ["Mathematics"])
+        self.assertEqual(
+            second.get_many(["subjects", "courses"]), {"subjects": ["Mathematics"]}
+        )
+        self.assertEqual(
+            second.stats(),
+            {"l1": {"hits": 2, "misses": 2}, "l2": {"hits": 1, "misses": 1}},
+        )
+
+    def test_invalidation_across_processes(self):
+        first, second = self.make_cache("first"), self.make_cache("second")
+        first.set("version", 1)
+        self.assertEqual(second.get("version"), 1)
+        first.set("version", 2)
+        # served locally until the stamps are checked, every SYNC_INTERVAL
+        self.assertEqual(second.get("version"), 1)
+        second.local.expire_sync()
+        self.assertEqual(second.get("version"), 2)
+        first.delete("version")
+        second.local.expire_sync()
+        self.assertIsNone(second.get("version"))
+
+    def test_writes_only_drop_their_key(self):
+        first, second = self.make_cache("first"), self.make_cache("second")
+        first.set_many({"a": 1, "b": 2})
+        self.assertEqual(second.get_many(["a", "b"]), {"a": 1, "b": 2})
+        first.set("a", 3)
+        first.delete("lock")
+        second.local.expire_sync()
+        # b is still served locally, a is read again
+        self.assertEqual(second.get_many(["a", "b"]), {"a": 3, "b": 2})
+        self.assertEqual(second.stats()["l1"], {"hits": 1, "misses": 3})
+        self.assertEqual(second.stats()["l2"], {"hits": 3, "misses": 0})
+        first.clear()
+        second.local.expire_sync()
+        self.assertEqual(second.get_many(["a", "b"]), {})
+
+    def test_own_writes_keep_local_entries(self):
+        tiered = self.make_cache("first")
+        tiered.set("a", 1)
+        tiered.set("b", 2)
+        self.assertEqual(tiered.get_many(["a", "b"]), {"a": 1, "b": 2})
+        self.assertEqual(tiered.stats()["l1"], {"hits": 2, "misses": 0})
+
+    def test_requests_do_not_reach_l2(self):
+        first, second = self.make_cache("first"), self.make_cache("second")
+        first.set_many({"a": 1, "b": 2})
+        second.get_many(["a", "b"])
+        with (
+            mock.patch.object(second.shared, "get", wraps=second.shared.get) as get,
+            mock.patch.object(
+                second.shared, "get_many", wraps=second.shared.get_many
+            ) as get_many,
+        ):
+            for _ in range(5):
+                request_started.send(sender=self.__class__)
+                self.assertEqual(second.get_many(["a", "b"]), {"a": 1, "b": 2})
+            self.assertEqual((get.call_count, get_many.call_count), (0, 0))
+            # one get_many() for the epoch and the stamps once the interval
+            # is over
+            second.local.expire_sync()
+            second.get("a")
+            self.assertEqual(get_many.call_count, 1)
+
+    def test_local_tier_is_bounded(self):
+        tiered = self.make_cache("first", MAX_ENTRIES=2)
+        for key in ("a", "b", "c"):
+            tiered.set(key, key)
+        self.assertEqual(list(tiered.local.entries), [":1:b", ":1:c"])
+        self.assertEqual(tiered.get("a"), "a")
+        self.assertEqual(tiered.stats()["l2"], {"hits": 1, "misses": 0})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.second = Module.objects.create(course=self.course, title="Second")
+        self.client.force_login(self.owner)
+
+    def post_order(self, data):
+        return self.client.post(
+            reverse("module_order"), data, content_type="application/json"
+        )
+
+    def current_order(self):
+        return dict(self.course.modules.values_list("id", "order"))
+
+    def test_reorder(self):
+        order = {self.module.pk: 1, self.second.pk: 0}
+        version = self.post_order(order).json()["version"]
+        self.assertEqual(self.current_order(), order)
+        # a client that loaded the list before that change
+        stale = {"order": {self.module.pk: 0, self.second.pk: 1}, "version": "0" * 16}
+        response = self.post_order(stale)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["version"], version)
+        self.assertEqual(self.current_order(), order)
+        response = self.post_order({**stale, "version": version})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.current_order(), stale["order"])
+
+    def test_reorder_contents(self):
+        texts = [
+            Text.objects.create(owner=self.owner, title=f"Text {n}", content="")
+            for n in range(3)
+        ]
+        contents = [
+            Content.objects.create(module=self.module, item=text) for text in texts
+        ]
+        self.module.refresh_from_db()
+        self.course.refresh_from_db()
+        # legacy payloads are a plain {id: order} mapping
+        response = self.client.post(
+            reverse("content_order"),
+            {contents[0].pk: 2, contents[2].pk: 0},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(self.module.contents.values_list("pk", flat=True)),
+            [contents[2].pk, contents[1].pk, contents[0].pk],
+        )
+        # bulk_update() sends no signals, the view bumps the versions
+        module = Module.objects.get(pk=self.module.pk)
+        self.assertEqual(module.contents_version, self.module.contents_version + 1)
+        course = Course.objects.get(pk=self.course.pk)
+        self.assertEqual(course.version, self.course.version + 1)
+
+    def test_invalid_payloads(self):
+        for data in ([1, 2], {}, {self.module.pk: "first"}, {"order": []}):
+            with self.subTest(data=data):
+                self.assertEqual(self.post_order(data).status_code, 400)
+        other = Course.objects.create(
+            owner=self.owner, subject=self.subject, title="Geometry", slug="geometry"
+        )
+        module = Module.objects.create(course=other, title="Other")
+        # one request reorders the children of a single parent
+        response = self.post_order({self.module.pk: 1, module.pk: 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.current_order(), {self.module.pk: 0, self.second.pk: 1})
+
+    def test_foreign_ids(self):
+        other = Course.objects.create(
+            owner=User.objects.create_user(username="other"),
+            subject=self.subject,
+            title="Geometry",
+            slug="geometry",
+        )
+        foreign = Module.objects.create(course=other, title="Foreign")
+        response = self.post_order({self.module.pk: 1, foreign.pk: 0})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Module.objects.get(pk=foreign.pk).order, 0)
+        self.assertEqual(self.current_order(), {self.module.pk: 0, self.second.pk: 1})
+
+    def test_concurrent_inserts(self):
+        # as if the rows were created before the sequences existed
+        OrderSequence.objects.all().delete()
+        field = Module._meta.get_field("order")
+        modules = [Module(course=self.course, title=f"New {n}") for n in range(3)]
+        # a concurrent request creates the sequence of the course first
+        field.create_sequence(modules[0], field.sequence_key(modules[0]))
+        for module in modules:
+            module.save()
+        bulk_create_ordered(
+            Module, [Module(course=self.course, title=f"Bulk {n}") for n in range(2)]
+        )
+        self.assertEqual(sorted(self.current_order().values()), list(range(7)))
+        # positions set by a reorder are not handed out again
+        self.post_order({self.module.pk: 10})
+        self.assertEqual(
+            Module.objects.create(course=self.course, title="Last").order, 11
+        )
+
+    def test_sequences_deleted_with_parent(self):
+        text = Text.objects.create(owner=self.owner, title="Text", content="")
+        Content.objects.create(module=self.module, item=text)
+        self.assertEqual(OrderSequence.objects.count(), 2)
+        self.module.delete()
+        self.assertEqual(OrderSequence.objects.count(), 1)
+        self.course.delete()
+        self.assertFalse(OrderSequence.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CourseTransferTests(CourseFixtureMixin, TestCase):
+    module_title = "First"
+
+    def setUp(self):
+        super().setUp()
+        self.owner.user_permissions.add(Permission.objects.get(codename="add_course"))
+        second = Module.objects.create(course=self.course, title="Second")
+        for module in (self.module, second):
+            title = module.title
+            for n in range(3):
+                text = Text.objects.create(
+                    owner=self.owner, title=f"{title} {n}", content="Content"
+                )
+                Content.objects.create(module=module, item=text)
+        file = File.objects.create(
+            owner=self.owner,
+            title="Slides",
+            file=SimpleUploadedFile("slides.pdf", b"%PDF slides"),
+        )
+        Content.objects.create(module=module, item=file)
+
+    def test_round_trip(self):
+        courses = Course.objects.filter(pk=self.course.pk)
+        lines = "".join(export_lines(courses))
+        media = b"".join(export_media(courses))
+        self.assertEqual(len(lines.splitlines()), 1 + 2 + 7)
+        name = File.objects.get().file.name
+        self.course.delete()
+        File.objects.all().delete()
+
+        stored = self.media_files()
+        response = self.post_import(lines, media)
+        self.assertEqual(response.status_code, 201)
+        course = Course.objects.get(pk__in=response.json()["courses"])
+        self.assertEqual(course.total_modules, 2)
+        self.assertEqual(course.subject.total_courses, 1)
+        modules = list(course.modules.all())
+        self.assertEqual([m.title for m in modules], ["First", "Second"])
+        contents = [c.item for c in modules[1].contents.with_items()]
+        self.assertEqual(
+            [item.title for item in contents],
+            ["Second 0", "Second 1", "Second 2", "Slides"],
+        )
+        with contents[-1].file.open("rb") as f:
+            self.assertEqual(f.read(), b"%PDF slides")
+        # the stored file is reused, not copied below its own directory
+        self.assertEqual(contents[-1].file.name, name)
+        self.assertEqual(self.media_files(), stored)
+        # new contents are added after the imported ones
+        text = Text.objects.create(owner=self.owner, title="Last", content="")
+        self.assertEqual(Content.objects.create(module=modules[1], item=text).order, 4)
+
+    def media_files(self):
+        return {
+            os.path.relpath(os.path.join(root, filename), settings.MEDIA_ROOT)
+            for root, _, filenames in os.walk(settings.MEDIA_ROOT)
+            for filename in filenames
+        }
+
+    def post_import(self, lines, media=None):
+        files = {"courses": SimpleUploadedFile("courses.jsonl", lines.encode())}
+        if media is not None:
+            files["media"] = SimpleUploadedFile("media.tar", media)
+        return self.client.post(
+            reverse("api:course-import-courses"), files, **basic_auth("owner")
+        )
+
+    def test_stored_names_are_rejected(self):
+        # a record pointing at a file already stored, e.g. of another user
+        other = File.objects.create(
+            owner=User.objects.create_user(username="other"),
+            title="Private",
+            file=SimpleUploadedFile("private.pdf", b"%PDF private"),
+        )
+        lines = "".join(export_lines(Course.objects.all()))
+        lines = lines.replace(File.objects.first().file.name, other.file.name)
+        lines = lines.replace('"algebra"', '"algebra-copy"')
+        response = self.post_import(lines)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(other.file.name, response.json()["detail"])
+        self.assertEqual(Course.objects.count(), 1)
+        self.assertEqual(File.objects.filter(file=other.file.name).count(), 1)
+
+    def test_failed_import_removes_media(self):
+        buffer = BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            info = tarfile.TarInfo("files/handout.pdf")
+            info.size = len(b"%PDF handout")
+            tar.addfile(info, BytesIO(b"%PDF handout"))
+        # the slug of the exported course is taken
+        lines = "".join(export_lines(Course.objects.all()))
+        response = self.post_import(lines, buffer.getvalue())
+        self.assertEqual(response.status_code, 400)
+        digest = hashlib.sha256(b"%PDF handout").hexdigest()
+        name = f"files/{digest[:2]}/{digest[2:4]}/{digest}.pdf"
+        self.assertFalse(File.objects.first().file.storage.exists(name))
+
+    def test_existing_slug(self):
+        lines = list(export_lines(Course.objects.all()))
+        out = StringIO()
+        path = tempfile.mktemp()
+        with open(path, "w") as f:
+            f.writelines(lines)
+        self.addCleanup(os.remove, path)
+        with self.assertRaisesMessage(CommandError, "algebra"):
+            call_command("import_courses", path, owner="owner", stdout=out)
+        self.assertEqual(Course.objects.count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ChunkedUploadTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.owner)
+
+    def start(self, **data):
+        data = {
+            "module": self.module.id,
+            "model": "file",
+            "title": "Lecture",
+            "filename": "lecture.pdf",
+            "size": 10,
+            **data,
+        }
+        return self.client.post(reverse("api:upload-list"), data)
+
+    def put_chunk(self, upload_id, offset, data, checksum=None):
+        return self.client.put(
+            reverse("api:upload-detail", args=[upload_id]),
+            data,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+            HTTP_UPLOAD_CHECKSUM=checksum or hashlib.sha256(data).hexdigest(),
+        )
+
+    def test_resumable_upload(self):
+        response = self.start()
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.json()["id"]
+        self.assertEqual(self.put_chunk(upload_id, 0, b"%PDF-1").json()["offset"], 6)
+        # a corrupted chunk is dropped, the upload resumes from the last one
+        response = self.put_chunk(upload_id, 6, b"xxxx", checksum="0" * 64)
+        self.assertEqual(response.status_code, 400)
+        response = self.put_chunk(upload_id, 0, b"%PDF-1")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 6)
+        response = self.client.get(reverse("api:upload-detail", args=[upload_id]))
+        self.assertEqual(response.json()["offset"], 6)
+        self.assertEqual(self.put_chunk(upload_id, 6, b".7 %").status_code, 200)
+
+        response = self.client.post(reverse("api:upload-complete", args=[upload_id]))
+        self.assertEqual(response.status_code, 200)
+        content = Content.objects.get(pk=response.json()["content"])
+        self.assertEqual(content.module, self.module)
+        with content.item.file.open("rb") as f:
+            self.assertEqual(f.read(), b"%PDF-1.7 %")
+        self.assertEqual(content.item.title, "Lecture")
+        # the part file was moved, not copied
+        upload = ChunkedUpload.objects.get(pk=upload_id)
+        self.assertFalse(os.path.exists(part_path(upload)))
+
+    def test_incomplete_upload(self):
+        upload_id = self.start().json()["id"]
+        self.put_chunk(upload_id, 0, b"%PDF")
+        response = self.client.post(reverse("api:upload-complete", args=[upload_id]))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Content.objects.exists())
+
+    def test_other_module(self):
+        self.client.force_login(User.objects.create_user(username="other"))
+        self.assertEqual(self.start().status_code, 400)
+
+    def test_part_files_are_not_served(self):
+        upload = ChunkedUpload.objects.get(pk=self.start().json()["id"])
+        self.assertTrue(os.path.exists(part_path(upload)))
+        self.assertFalse(part_path(upload).startswith(settings.MEDIA_ROOT))
+
+    def test_chunk_overtaken_while_received(self):
+        upload = ChunkedUpload.objects.get(pk=self.start().json()["id"])
+
+        class Stream:
+            # the same chunk sent again by the client while the first
+            # request is still receiving it
+            def read(self, size):
+                ChunkedUpload.objects.filter(pk=upload.pk).update(offset=4)
+                return b"%PDF"
+
+        checksum = hashlib.sha256(b"%PDF").hexdigest()
+        with self.assertRaises(OffsetMismatch):
+            write_chunk(upload, 0, 4, Stream(), checksum)
+        self.assertEqual(os.path.getsize(part_path(upload)), 0)
+
+    def test_expire_uploads(self):
+        old, recent, complete = (self.start().json()["id"] for _ in range(3))
+        self.put_chunk(complete, 0, b"%PDF-1.7 %")
+        self.client.post(reverse("api:upload-complete", args=[complete]))
+        ChunkedUpload.objects.exclude(pk=recent).update(
+            updated=timezone.now() - timedelta(days=2)
+        )
+        old_part = part_path(ChunkedUpload.objects.get(pk=old))
+        out = StringIO()
+        call_command("expire_uploads", stdout=out)
+        self.assertIn("Removed 1 abandoned uploads", out.getvalue())
+        self.assertFalse(os.path.exists(old_part))
+        self.assertQuerySetEqual(
+            ChunkedUpload.objects.values_list("pk", flat=True),
+            [uuid.UUID(recent), uuid.UUID(complete)],
+            ordered=False,
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, BACKGROUND_WORKERS=0)
+class ImageVariantTests(CourseFixtureMixin, TestCase):
+
+    def create_image(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(
+                owner=self.owner,
+                title="Photo",
+                file=SimpleUploadedFile("photo.png", data),
+            )
+        return Image.objects.get(pk=image.pk)
+
+    def test_variants(self):
+        buffer = BytesIO()
+        PILImage.new("RGBA", (2000, 1000), "red").save(buffer, "PNG")
+        image = self.create_image(buffer.getvalue())
+        files = image.variants["files"]
+        # only the variants the template shows
+        self.assertEqual(set(files), {"content", "webp"})
+        with image.file.storage.open(files["content"]) as f:
+            self.assertEqual(PILImage.open(f).size, (1280, 640))
+        with image.file.storage.open(files["webp"]) as f:
+            self.assertEqual(PILImage.open(f).format, "WEBP")
+        # the stored fragment was re-rendered with the variants
+        html = image.render()
+        self.assertIn(image.variant_urls()["webp"], html)
+        self.assertIn(image.variant_urls()["content"], html)
+        self.assertIn(reverse("item_download", args=["image", image.pk]), html)
+        self.assertNotIn(image.file.url, html)
+
+    def test_not_an_image(self):
+        image = self.create_image(b"not an image")
+        self.assertEqual(image.variants, {"source": image.file.name, "files": {}})
+        self.assertEqual(image.variant_urls(), {})
+
+
+@override_settings(CACHES=LOCMEM_CACHES, BACKGROUND_WORKERS=0)
+class VideoMetadataTests(TestCase):
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner")
+
+    def test_resolved_on_save(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            video = Video.objects.create(owner=self.owner, title="Clip", url=self.url)
+        # the thumbnail is left to the background job
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(video.provider, "youtube")
+        self.assertEqual(video.video_id, "dQw4w9WgXcQ")
+        self.assertEqual(video.thumbnail_url, "")
+        # rendering only outputs the stored code
+        with mock.patch("courses.embeds.detect_backend", side_effect=AssertionError):
+            html = Video.objects.get(pk=video.pk).render_template()
+        self.assertIn('src="https://www.youtube.com/embed/dQw4w9WgXcQ', html)
+
+    def test_fetch_metadata(self):
+        with mock.patch("embed_video.backends.requests.head") as head:
+            head.return_value.status_code = 200
+            with self.captureOnCommitCallbacks(execute=True):
+                video = Video.objects.create(
+                    owner=self.owner, title="Clip", url=self.url
+                )
+            video.refresh_from_db()
+            self.assertEqual(
+                video.thumbnail_url,
+                "https://img.youtube.com/vi/dQw4w9WgXcQ/maxresdefault.jpg",
+            )
+            # saves keeping the url do not fetch again
+            with self.captureOnCommitCallbacks(execute=True):
+                video.title = "Renamed"
+                video.save()
+        self.assertEqual(head.call_count, 1)
+        video.url = "https://vimeo.com/76979871"
+        with self.captureOnCommitCallbacks() as callbacks:
+            video.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual((video.provider, video.thumbnail_url), ("vimeo", ""))
+        self.assertIn("player.vimeo.com/video/76979871", video.render_template())
+
+    def test_unknown_provider(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            video = Video.objects.create(
+                owner=self.owner, title="Clip", url="https://example.com/clip"
+            )
+        self.assertEqual(callbacks, [])
+        self.assertEqual((video.provider, video.embed_html), ("", ""))
+        self.assertIn('href="https://example.com/clip"', video.render_template())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ItemDownloadTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.file = File.objects.create(
+            owner=self.owner,
+            title="Notes",
+            file=SimpleUploadedFile("notes.txt", b"0123456789"),
+        )
+        Content.objects.create(module=self.module, item=self.file)
+        self.url = reverse("item_download", args=["file", self.file.pk])
+        self.student = User.objects.create_user(username="student")
+        self.client.force_login(self.student)
+
+    def test_enrollment_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.students.add(self.student)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="notes.txt"'
+        )
+
+    def test_owner(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_range(self):
+        self.course.students.add(self.student)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(response.streaming_content), b"789")
+        response = self.client.get(self.url, HTTP_RANGE="bytes=10-")
+        self.assertEqual(response.status_code, 416)
+
+    @override_settings(
+        MEDIA_SENDFILE="x-accel-redirect",
+        MEDIA_ACCEL_REDIRECT_PREFIX="/protected-media/",
+    )
+    def test_accel_redirect(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response["X-Accel-Redirect"], f"/protected-media/{self.file.file.name}"
+        )
+        self.assertEqual(response.content, b"")
+
+    def test_missing_file(self):
+        self.client.force_login(self.owner)
+        os.remove(self.file.file.path)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_public_media(self):
+        # the media route added in DEBUG
+        request = RequestFactory().get("/")
+        for path in (self.file.file.name, "images/variants/../ab/photo.png"):
+            with self.subTest(path=path), self.assertRaises(Http404):
+                serve_public_media(request, path, settings.MEDIA_ROOT)
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, "images/variants"))
+        with open(
+            os.path.join(settings.MEDIA_ROOT, "images/variants/a-320.webp"), "wb"
+        ):
+            pass
+        response = serve_public_media(
+            request, "images/variants/a-320.webp", settings.MEDIA_ROOT
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ContentAddressedStorageTests(CourseFixtureMixin, TestCase):
+
+    def add_file(self, data, name="slides.pdf"):
+        file = File.objects.create(
+            owner=self.owner, title="Slides", file=SimpleUploadedFile(name, data)
+        )
+        return Content.objects.create(module=self.module, item=file)
+
+    def test_files_are_shared(self):
+        first = self.add_file(b"%PDF slides").item
+        second = self.add_file(b"%PDF slides", name="copy.PDF").item
+        other = self.add_file(b"%PDF other").item
+        digest = hashlib.sha256(b"%PDF slides").hexdigest()
+        self.assertEqual(
+            first.file.name, f"files/{digest[:2]}/{digest[2:4]}/{digest}.pdf"
+        )
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertNotEqual(other.file.name, first.file.name)
+        storage = first.file.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(second.file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(storage.exists(second.file.name))
+        self.assertTrue(storage.exists(other.file.name))
+
+    def test_shared_between_models(self):
+        file = self.add_file(b"\x89PNG data", name="figure.png").item
+        # names are shared between models by imports and dedupe_files
+        image = Image.objects.create(
+            owner=self.owner, title="Figure", file=file.file.name
+        )
+        self.assertTrue(StoredFile.objects.filter(name=file.file.name).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            file.delete()
+        # still used by the image
+        self.assertTrue(image.file.storage.exists(image.file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertFalse(image.file.storage.exists(image.file.name))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_content_delete_view(self):
+        content = self.add_file(b"%PDF slides")
+        name = content.item.file.name
+        self.client.force_login(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("module_content_delete", args=[content.id]))
+        self.assertFalse(content.item.file.storage.exists(name))
+
+    def test_replaced_file(self):
+        item = self.add_file(b"%PDF slides").item
+        name = item.file.name
+        item.file = SimpleUploadedFile("slides.pdf", b"%PDF new slides")
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        self.assertFalse(item.file.storage.exists(name))
+        self.assertTrue(item.file.storage.exists(item.file.name))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner")
+        subject = Subject.objects.create(title="Mathematics", slug="mathematics")
+        self.course = Course.objects.create(
+            owner=self.owner,
+            subject=subject,
+            title="Linear algebra",
+            slug="linear-algebra",
+            overview="Vectors, matrices and eigenvalues.",
+        )
+        self.module = Module.objects.create(
+            course=self.course, title="Matrices", description="Products"
+        )
+        self.text = Text.objects.create(
+            owner=self.owner, title="Eigenvalues", content="Diagonalizable matrices."
+        )
+        self.content = Content.objects.create(module=self.module, item=self.text)
+
+    def search(self, query, **params):
+        response = self.client.get(reverse("api:search"), {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_ranked_results(self):
+        data = self.search("eigenval")
+        self.assertEqual(data["count"], 2)
+        # the title match ranks first
+        self.assertEqual(
+            [(r["kind"], r["title"]) for r in data["results"]],
+            [("text", "Eigenvalues"), ("course", "Linear algebra")],
+        )
+        self.assertEqual(
+            data["results"][0]["url"],
+            reverse(
+                "student_course_detail_module", args=[self.course.id, self.module.id]
+            ),
+        )
+        # every term must match, engine syntax is ignored
+        self.assertEqual(self.search("matrices products")["count"], 1)
+        self.assertEqual(self.search('"matric* (')["count"], 3)
+        self.assertEqual(self.search("")["count"], 0)
+
+    def test_pagination(self):
+        for n in range(12):
+            Module.objects.create(course=self.course, title=f"Vectors {n}")
+        # count, page ids and page rows
+        with self.assertNumQueries(3):
+            data = self.search("vectors", page=2)
+        self.assertEqual(data["count"], 13)
+        self.assertEqual(len(data["results"]), 3)
+        self.assertIsNone(data["next"])
+
+    def test_incremental_updates(self):
+        self.text.title = "Eigenvectors"
+        self.text.content = "Spectral theorem."
+        self.text.save()
+        self.assertEqual(self.search("spectral")["results"][0]["title"], "Eigenvectors")
+        self.assertEqual(self.search("diagonalizable")["count"], 0)
+        self.content.delete()
+        self.assertEqual(self.search("spectral")["count"], 0)
+        self.module.delete()
+        self.assertEqual(self.search("products")["count"], 0)
+        self.course.delete()
+        self.assertEqual(SearchEntry.objects.count(), 0)
+
+    def test_rebuild(self):
+        SearchEntry.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("Indexed 3 search entries", out.getvalue())
+        self.assertEqual(self.search("diagonalizable")["count"], 1)
+
+    def test_lost_triggers(self):
+        # as left by a migration rebuilding the table on SQLite
+        with connection.cursor() as cursor:
+            for sql in search.SQLITE_DROP[:3]:
+                cursor.execute(sql)
+        self.assertEqual(
+            [message.id for message in check_search_index(None, ["default"])],
+            ["courses.W001"],
+        )
+        Module.objects.create(course=self.course, title="Determinants")
+        self.assertEqual(self.search("determinants")["count"], 0)
+        # a partial rebuild recreates the whole index
+        call_command("rebuild_search_index", self.course.pk, stdout=StringIO())
+        self.assertEqual(search.missing_index(), [])
+        self.assertEqual(self.search("determinants")["count"], 1)
+        self.assertEqual(self.search("diagonalizable")["count"], 1)
+        self.assertEqual(check_search_index(None, ["default"]), [])
+
+    def test_catalog_search(self):
+        self.assertContains(self.client.get(reverse("course_list")), 'name="q"')
+        response = self.client.get(reverse("course_search"), {"q": "matrices"})
+        self.assertContains(response, "Eigenvalues")
+        self.assertContains(response, reverse("course_detail", args=["linear-algebra"]))
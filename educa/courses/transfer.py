@@ -0,0 +1,347 @@
+import json
+import posixpath
+import tarfile
+from collections import Counter
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .cache import bump_catalog_version
+from .counters import bump_course_version, recount_courses, recount_modules
+from .embeds import resolve_video, schedule_metadata
+from .fields import bulk_create_ordered
+from .imaging import schedule_variants
+from .search import rebuild_index
+from .storage import content_storage, discard_file
+from .models import (
+    Content,
+    Course,
+    File as FileItem,
+    Image,
+    Module,
+    Subject,
+    Text,
+    Video,
+)
+
+# courses are moved as JSON Lines, one record per course, module and
+# content (with its item), in dependency order; the files of File and Image
+# items travel in a separate tarball
+EXPORT_CHUNK_SIZE = 500
+IMPORT_BATCH_SIZE = 1000
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+ITEM_TYPES = {model._meta.model_name: model for model in (Text, Video, Image, FileItem)}
+FILE_ITEM_MODELS = (Image, FileItem)
+
+
+class TransferError(ValueError):
+    pass
+
+
+def item_fields(model):
+    # the fields of an item besides its owner and timestamps
+    return [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.editable and not field.primary_key and field.name != "owner"
+    ]
+
+
+# export
+def export_records(courses):
+    courses = courses.select_related("subject").order_by("id")
+    for course in courses.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            "type": "course",
+            "id": course.id,
+            "subject": {"title": course.subject.title, "slug": course.subject.slug},
+            "title": course.title,
+            "slug": course.slug,
+            "overview": course.overview,
+        }
+        for module in course.modules.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield {
+                "type": "module",
+                "id": module.id,
+                "course": course.id,
+                "title": module.title,
+                "description": module.description,
+                "order": module.order,
+            }
+        contents = (
+            Content.objects.filter(module__course=course)
+            .order_by("module__order", "module_id", "order")
+            .with_items()
+        )
+        for content in contents.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            item = content.item
+            if item is None:
+                continue
+            yield {
+                "type": "content",
+                "module": content.module_id,
+                "order": content.order,
+                "item": {
+                    "model": item._meta.model_name,
+                    **{
+                        name: str(getattr(item, name))
+                        for name in item_fields(type(item))
+                    },
+                },
+            }
+
+
+def export_lines(courses):
+    for record in export_records(courses):
+        yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+
+
+def media_files(courses):
+    seen = set()
+    for model in FILE_ITEM_MODELS:
+        items = model.objects.filter(
+            id__in=Content.objects.filter(
+                module__course__in=courses,
+                content_type=ContentType.objects.get_for_model(model),
+            ).values("object_id")
+        ).only("file")
+        for item in items.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            if item.file.name and item.file.name not in seen:
+                seen.add(item.file.name)
+                yield item.file
+
+
+def export_media(courses):
+    # an uncompressed tar stream written file by file, chunk by chunk
+    size = 0
+    for file in media_files(courses):
+        info = tarfile.TarInfo(file.name)
+        try:
+            info.size = file.size
+        except FileNotFoundError:
+            # the item keeps its name, there is nothing to copy
+            continue
+        header = info.tobuf(format=tarfile.PAX_FORMAT)
+        yield header
+        with file.open("rb"):
+            for chunk in file.chunks(MEDIA_CHUNK_SIZE):
+                yield chunk
+        padding = -info.size % tarfile.BLOCKSIZE
+        yield tarfile.NUL * padding
+        size += len(header) + info.size + padding
+    end = 2 * tarfile.BLOCKSIZE
+    yield tarfile.NUL * (end + -(size + end) % tarfile.RECORDSIZE)
+
+
+# import
+def import_media(fileobj, names=None):
+    # store the files of a media tarball, returns {exported name: new name};
+    # "names" is filled as the files are written
+    names = {} if names is None else names
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                name = posixpath.normpath(member.name)
+                if name.startswith(("/", "../")) or name == "..":
+                    raise TransferError(f"Invalid media file name: {member.name}")
+                content = File(tar.extractfile(member), name=name)
+                content.size = member.size
+                names[member.name] = content_storage.save(name, content)
+    except tarfile.TarError as e:
+        raise TransferError(f"Invalid media tarball: {e}") from None
+    return names
+
+
+class CourseImporter:
+    # buffers the records of a JSON Lines stream and inserts them with one
+    # bulk_create() per model and batch
+
+    def __init__(self, owner, media_names=None, batch_size=IMPORT_BATCH_SIZE):
+        self.owner = owner
+        self.media_names = media_names or {}
+        self.batch_size = batch_size
+        self.subjects = {}
+        self.courses = {}
+        self.modules = {}
+        self.images = []
+        self.videos = []
+        self.pending = {"course": [], "module": [], "content": []}
+        self.size = 0
+
+    def add(self, record):
+        kind = record.get("type") if isinstance(record, dict) else None
+        if kind not in self.pending:
+            raise TransferError(f"Unknown record: {record!r}")
+        self.pending[kind].append(record)
+        self.size += 1
+        if self.size >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.create_courses(self.pending["course"])
+        self.create_modules(self.pending["module"])
+        self.create_contents(self.pending["content"])
+        self.pending = {"course": [], "module": [], "content": []}
+        self.size = 0
+
+    def get_subject_id(self, data):
+        slug = data["slug"]
+        if slug not in self.subjects:
+            subject, _ = Subject.objects.get_or_create(
+                slug=slug, defaults={"title": data["title"]}
+            )
+            self.subjects[slug] = subject.id
+        return self.subjects[slug]
+
+    def create_courses(self, records):
+        if not records:
+            return
+        slugs = Counter(record["slug"] for record in records)
+        taken = {slug for slug, count in slugs.items() if count > 1}
+        taken.update(
+            Course.objects.filter(slug__in=slugs).values_list("slug", flat=True)
+        )
+        if taken:
+            raise TransferError(
+                f"Course slugs already exist: {', '.join(sorted(taken))}"
+            )
+        courses = Course.objects.bulk_create(
+            [
+                Course(
+                    owner=self.owner,
+                    subject_id=self.get_subject_id(record["subject"]),
+                    title=record["title"],
+                    slug=record["slug"],
+                    overview=record["overview"],
+                )
+                for record in records
+            ]
+        )
+        for record, course in zip(records, courses):
+            self.courses[record["id"]] = course
+
+    def create_modules(self, records):
+        if not records:
+            return
+        modules = [
+            Module(
+                course=self.get_parent(self.courses, record["course"], "course"),
+                title=record["title"],
+                description=record.get("description", ""),
+                order=record.get("order"),
+            )
+            for record in records
+        ]
+        bulk_create_ordered(Module, modules)
+        self.advance(Module, modules, "course_id")
+        for record, module in zip(records, modules):
+            self.modules[record["id"]] = module
+
+    def create_contents(self, records):
+        if not records:
+            return
+        items = {}
+        for record in records:
+            item = record["item"]
+            model = ITEM_TYPES.get(item.get("model"))
+            if model is None:
+                raise TransferError(f"Unknown item type: {item.get('model')!r}")
+            data = {name: item[name] for name in item_fields(model) if name in item}
+            if data.get("file"):
+                # only files of this import, never a name already stored
+                if data["file"] not in self.media_names:
+                    raise TransferError(
+                        f"File not in the media of the import: {data['file']}"
+                    )
+                data["file"] = self.media_names[data["file"]]
+            items.setdefault(model, []).append(model(owner=self.owner, **data))
+        for video in items.get(Video, []):
+            resolve_video(video)
+        for model, objs in items.items():
+            model.objects.bulk_create(objs)
+        self.images.extend(image.pk for image in items.get(Image, []))
+        self.videos.extend(video.pk for video in items.get(Video, []) if video.provider)
+        created = {model: iter(objs) for model, objs in items.items()}
+        contents = []
+        for record in records:
+            model = ITEM_TYPES[record["item"]["model"]]
+            contents.append(
+                Content(
+                    module=self.get_parent(self.modules, record["module"], "module"),
+                    item=next(created[model]),
+                    order=record.get("order"),
+                )
+            )
+        bulk_create_ordered(Content, contents)
+        self.advance(Content, contents, "module_id")
+
+    def get_parent(self, parents, pk, name):
+        try:
+            return parents[pk]
+        except KeyError:
+            raise TransferError(f"Unknown {name}: {pk!r}") from None
+
+    def advance(self, model, objs, parent_field):
+        # keep the order sequences after the imported positions
+        last = {}
+        for obj in objs:
+            parent = getattr(obj, parent_field)
+            if last.get(parent, (None, -1))[1] < obj.order:
+                last[parent] = (obj, obj.order)
+        field = model._meta.get_field("order")
+        for obj, order in last.values():
+            field.advance(obj, order)
+
+    def finish(self):
+        # bulk_create() sends no signals, update what the receivers would
+        course_ids = [course.id for course in self.courses.values()]
+        subject_ids = {course.subject_id for course in self.courses.values()}
+        recount_courses(subject_ids)
+        recount_modules(course_ids)
+        bump_course_version(pk__in=course_ids)
+        rebuild_index(course_ids)
+        transaction.on_commit(lambda: bump_catalog_version(*subject_ids))
+        transaction.on_commit(lambda: schedule_variants(self.images))
+        transaction.on_commit(lambda: schedule_metadata(self.videos))
+        return course_ids
+
+
+def import_lines(lines, owner, media_names=None):
+    # returns the ids of the new courses
+    importer = CourseImporter(owner, media_names)
+    with transaction.atomic():
+        try:
+            for number, line in enumerate(lines, 1):
+                if isinstance(line, bytes):
+                    line = line.decode()
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    raise TransferError(f"Line {number} is not valid JSON") from None
+                importer.add(record)
+            importer.flush()
+        except (KeyError, TypeError) as e:
+            raise TransferError(f"Invalid record, missing {e}") from None
+        return importer.finish()
+
+
+def import_courses(lines, owner, media=None):
+    # import the courses and the files of their media tarball in one
+    # transaction; the files written are removed again when it fails
+    names = {}
+    try:
+        with transaction.atomic():
+            if media is not None:
+                import_media(media, names)
+            return import_lines(lines, owner, names)
+    except BaseException:
+        for name in set(names.values()):
+            discard_file(name)
+        raise
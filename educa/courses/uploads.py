@@ -0,0 +1,136 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChunkedUpload, Content
+
+# chunked uploads are written to UPLOAD_ROOT/<id>.part, outside MEDIA_ROOT
+# so they are never served, and moved to the storage of the item once
+# complete
+# suggested size of the chunks sent by clients
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# bytes read from the request at a time
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+# incomplete uploads left alone for longer are removed by expire_uploads()
+UPLOAD_EXPIRY = timedelta(days=1)
+
+
+class UploadError(ValueError):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    def __init__(self, offset):
+        super().__init__(f"Expected a chunk at offset {offset}")
+        self.offset = offset
+
+
+class PartFile(File):
+    # lets the file system storage move the part file instead of copying it
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(upload):
+    return os.path.join(settings.UPLOAD_ROOT, f"{upload.pk}.part")
+
+
+def start_upload(upload):
+    os.makedirs(settings.UPLOAD_ROOT, exist_ok=True)
+    open(part_path(upload), "wb").close()
+
+
+def delete_part(upload):
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def write_chunk(upload, offset, length, stream, checksum):
+    # append "length" bytes read from "stream" at "offset"; a chunk with a
+    # wrong checksum is dropped and can be sent again. The chunk is received
+    # before the upload gets locked, the lock only covers appending it
+    check_chunk(upload, offset, length)
+    with receive_chunk(length, stream, checksum) as chunk:
+        with transaction.atomic():
+            upload = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+            # another request may have sent the same chunk meanwhile
+            check_chunk(upload, offset, length)
+            with open(part_path(upload), "ab") as part:
+                # leftovers of an interrupted append
+                part.truncate(offset)
+                shutil.copyfileobj(chunk, part)
+            upload.offset = offset + length
+            upload.save(update_fields=["offset", "updated"])
+    return upload
+
+
+def check_chunk(upload, offset, length):
+    if upload.content_id:
+        raise UploadError("The upload is already complete")
+    if offset != upload.offset:
+        raise OffsetMismatch(upload.offset)
+    if offset + length > upload.size:
+        raise UploadError("The chunk goes past the end of the file")
+
+
+def receive_chunk(length, stream, checksum):
+    # the chunk in a temporary file, checked against its length and checksum
+    chunk = tempfile.TemporaryFile(dir=settings.UPLOAD_ROOT)
+    try:
+        digest = hashlib.sha256()
+        remaining = length
+        while remaining:
+            block = stream.read(min(remaining, UPLOAD_BLOCK_SIZE))
+            if not block:
+                break
+            chunk.write(block)
+            digest.update(block)
+            remaining -= len(block)
+        if remaining:
+            raise UploadError("The chunk is incomplete")
+        if digest.hexdigest() != checksum.lower():
+            raise UploadError("The checksum of the chunk does not match")
+    except BaseException:
+        chunk.close()
+        raise
+    chunk.seek(0)
+    return chunk
+
+
+def complete_upload(upload):
+    # create the item and its content; completing twice is a no-op
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.content_id:
+            return upload
+        if upload.offset != upload.size:
+            raise UploadError(f"Only {upload.offset} of {upload.size} bytes received")
+        model = apps.get_model("courses", upload.model_name)
+        item = model(owner=upload.owner, title=upload.title)
+        with open(part_path(upload), "rb") as part:
+            item.file.save(upload.filename, PartFile(part), save=False)
+        item.save()
+        upload.content = Content.objects.create(module=upload.module, item=item)
+        upload.save(update_fields=["content", "updated"])
+    # left behind when the content was already stored
+    delete_part(upload)
+    return upload
+
+
+def expire_uploads(age=UPLOAD_EXPIRY):
+    # remove the incomplete uploads not written to for "age"; their part
+    # files go with them, see courses.signals
+    uploads = ChunkedUpload.objects.filter(
+        content__isnull=True, updated__lt=timezone.now() - age
+    )
+    return uploads.delete()[1].get(ChunkedUpload._meta.label, 0)
@@ -33,6 +33,12 @@ urlpatterns = [
     ),
     path("module/order/", views.ModuleOrderView.as_view(), name="module_order"),
     path("content/order/", views.ContentOrderView.as_view(), name="content_order"),
+    path(
+        "media/<model_name>/<int:id>/",
+        views.ItemDownloadView.as_view(),
+        name="item_download",
+    ),
+    path("search/", views.CourseSearchView.as_view(), name="course_search"),
     path(
         "subject/<slug:subject>/",
         views.CourseListView.as_view(),
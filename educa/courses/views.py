@@ -16,10 +16,13 @@ from django.forms.models import modelform_factory
 from .models import Module, Content
 
 # Import for drag and drop feature
+import hashlib
 from braces.views import CsrfExemptMixin, JsonRequestResponseMixin
+from django.db import transaction
+from .counters import bump_contents_version, bump_course_version
 
 # Imports for rendering to the public, course list
-from django.db.models import Count
+from django.db.models import Prefetch
 from .models import Subject
 
 # import for rendering to the public, course detail
@@ -28,8 +31,21 @@ from django.views.generic.detail import DetailView
 # import to add enroll button to course overview
 from students.forms import CourseEnrollForm
 
-# import to cache some queries
-from django.core.cache import cache
+# import to cache the public catalog
+from .catalog import get_courses, get_subjects
+
+# imports for protected downloads
+import os
+from django.utils.text import slugify
+from django.contrib.contenttypes.models import ContentType
+from django.http import Http404
+from .downloads import serve_file
+from .enrollment import get_enrolled_course_ids
+from .models import File, Image
+
+# imports for the catalog search
+from django.core.paginator import Paginator
+from .search import SearchResults
 
 
 # Mixins to be used with courses, modules and content
@@ -172,26 +188,123 @@ class ModuleContentListView(TemplateResponseMixin, View):
     template_name = "courses/manage/module/content_list.html"
 
     def get(self, request, module_id):
-        module = get_object_or_404(Module, id=module_id, course__owner=request.user)
-        return self.render_to_response({"module": module})
+        module = get_object_or_404(
+            Module.objects.prefetch_related(
+                Prefetch("contents", queryset=Content.objects.with_items())
+            ),
+            id=module_id,
+            course__owner=request.user,
+        )
+        modules = list(module.course.modules.all())
+        return self.render_to_response(
+            {
+                "module": module,
+                "modules": modules,
+                "module_order_version": order_version({m.id: m.order for m in modules}),
+                "content_order_version": order_version(
+                    {c.id: c.order for c in module.contents.all()}
+                ),
+            }
+        )
 
 
-# To drag and drop a module
-class ModuleOrderView(CsrfExemptMixin, JsonRequestResponseMixin, View):
-    def post(self, request):
-        for id, order in self.request_json.items():
-            Module.objects.filter(id=id, course__owner=request.user).update(order=order)
-        return self.render_json_response({"saved": "OK"})
+# version token of the order of a list of modules or contents
+def order_version(orders):
+    data = ",".join(f"{pk}:{order}" for pk, order in sorted(orders.items()))
+    return hashlib.sha1(data.encode()).hexdigest()[:16]
 
 
-# To drag and drop a content
-class ContentOrderView(CsrfExemptMixin, JsonRequestResponseMixin, View):
+# Reorders the children of a single parent in one transaction
+class BulkOrderMixin(CsrfExemptMixin, JsonRequestResponseMixin):
+    model = None
+    parent_field = None
+    owner_lookup = None
+
     def post(self, request):
-        for id, order in self.request_json.items():
-            Content.objects.filter(id=id, module__course__owner=request.user).update(
-                order=order
+        data = self.request_json
+        if not isinstance(data, dict):
+            return self.render_bad_request_response()
+        # legacy payloads only contain the {id: order} mapping
+        version = data.get("version") if "order" in data else None
+        try:
+            orders = {
+                int(pk): int(order) for pk, order in data.get("order", data).items()
+            }
+        except (AttributeError, TypeError, ValueError):
+            return self.render_bad_request_response()
+        if not orders:
+            return self.render_bad_request_response()
+
+        # validate ownership of every object with a single query
+        parents = dict(
+            self.model.objects.filter(
+                id__in=orders, **{self.owner_lookup: request.user}
+            ).values_list("id", self.parent_field)
+        )
+        if len(parents) != len(orders):
+            return self.render_json_response({"error": "forbidden"}, status=403)
+        if len(set(parents.values())) > 1:
+            return self.render_bad_request_response(
+                {"error": "objects belong to different parents"}
+            )
+
+        with transaction.atomic():
+            siblings = list(
+                self.model.objects.select_for_update()
+                .filter(**{self.parent_field: parents.popitem()[1]})
+                .only("id", "order", self.parent_field)
+            )
+            current = {obj.id: obj.order for obj in siblings}
+            if version is not None and version != order_version(current):
+                # somebody else reordered since the client loaded the list
+                return self.render_json_response(
+                    {
+                        "error": "conflict",
+                        "order": current,
+                        "version": order_version(current),
+                    },
+                    status=409,
+                )
+            changed = [
+                obj for obj in siblings if orders.get(obj.id, obj.order) != obj.order
+            ]
+            for obj in changed:
+                obj.order = orders[obj.id]
+                current[obj.id] = obj.order
+            self.model.objects.bulk_update(changed, ["order"])
+            # new inserts must land after the highest position
+            self.model._meta.get_field("order").advance(
+                siblings[0], max(current.values())
             )
-        return self.render_json_response({"saved": "OK"})
+            self.order_changed(siblings[0])
+        return self.render_json_response(
+            {"saved": "OK", "order": current, "version": order_version(current)}
+        )
+
+    def order_changed(self, obj):
+        # bulk_update() sends no signals
+        pass
+
+
+# To drag and drop a module
+class ModuleOrderView(BulkOrderMixin, View):
+    model = Module
+    parent_field = "course"
+    owner_lookup = "course__owner"
+
+    def order_changed(self, obj):
+        bump_course_version(pk=obj.course_id)
+
+
+# To drag and drop a content
+class ContentOrderView(BulkOrderMixin, View):
+    model = Content
+    parent_field = "module"
+    owner_lookup = "module__course__owner"
+
+    def order_changed(self, obj):
+        bump_contents_version(pk=obj.module_id)
+        bump_course_version(modules=obj.module_id)
 
 
 #########################################################
@@ -201,32 +314,11 @@ class CourseListView(TemplateResponseMixin, View):
     template_name = "courses/course/list.html"
 
     def get(self, request, subject=None):
-        # to be replaced by caching
-        """
-        subjects = Subject.objects.annotate(
-            total_courses=Count('courses')
-        )
-        """
-
-        subjects = cache.get("all_subjects")
-        if not subjects:
-            subjects = Subject.objects.annotate(total_courses=Count("courses"))
-            cache.set("all_subjects", subjects)
-
-        # cached content
-        all_courses = Course.objects.annotate(total_modules=Count("modules"))
+        # cached, evaluated catalog rows; see courses.catalog
+        subjects = get_subjects()
         if subject:
             subject = get_object_or_404(Subject, slug=subject)
-            key = f"subject_{subbject.id}_courses"
-            courses = cache.get(key)
-            if not courses:
-                courses = all_courses.filter(subject=subject)
-                cache.set(key, courses)
-        else:
-            courses = cache.get("all_courses")
-            if not courses:
-                courses = all_courses
-                cache.set("all_courses", courses)
+        courses = get_courses(subject)
         return self.render_to_response(
             {"subjects": subjects, "subject": subject, "courses": courses}
         )
@@ -241,3 +333,47 @@ class CourseDetailView(DetailView):
         context = super().get_context_data(**kwargs)
         context["enroll_form"] = CourseEnrollForm(initial={"course": self.object})
         return context
+
+
+# catalog search, ranked and paginated; see courses.search
+class CourseSearchView(TemplateResponseMixin, View):
+    template_name = "courses/course/search.html"
+    paginate_by = 10
+
+    def get(self, request):
+        query = request.GET.get("q", "").strip()
+        paginator = Paginator(SearchResults(query), self.paginate_by)
+        page = paginator.get_page(request.GET.get("page"))
+        return self.render_to_response({"query": query, "page": page})
+
+
+# protected download of the original of a File or Image item, for its
+# owner and the students of the courses using it
+class ItemDownloadView(LoginRequiredMixin, View):
+    item_models = {"file": File, "image": Image}
+
+    def get(self, request, model_name, id):
+        model = self.item_models.get(model_name)
+        if model is None:
+            raise Http404("Unknown item type")
+        item = get_object_or_404(
+            model.objects.only("owner", "title", "file", "updated"), id=id
+        )
+        if item.owner_id != request.user.id and not self.is_enrolled(model, id):
+            raise Http404("No item found matching the query")
+        return serve_file(
+            request,
+            item.file,
+            item.updated,
+            as_attachment="inline" not in request.GET,
+            # stored files are named after their content
+            filename=slugify(item.title) + os.path.splitext(item.file.name)[1],
+        )
+
+    def is_enrolled(self, model, id):
+        # courses using the item, checked against the cached enrollments
+        course_ids = Content.objects.filter(
+            content_type=ContentType.objects.get_for_model(model), object_id=id
+        ).values_list("module__course_id", flat=True)
+        enrolled = get_enrolled_course_ids(self.request.user)
+        return not enrolled.isdisjoint(course_ids)
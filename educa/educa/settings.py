@@ -64,10 +64,21 @@ CACHES = {
 }
 """
 
+# hot keys are served from a small per-process cache in front of Redis,
+# see courses.cache_backends
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.redis.RedisCache",
-        "LOCATION": "redis://127.0.0.1:6379",
+        "BACKEND": "courses.cache_backends.TieredCache",
+        "LOCATION": "default",
+        "OPTIONS": {
+            "L2": {
+                "BACKEND": "django.core.cache.backends.redis.RedisCache",
+                "LOCATION": "redis://127.0.0.1:6379",
+            },
+            "L1_TIMEOUT": 5,
+            "SYNC_INTERVAL": 1,
+            "MAX_ENTRIES": 1000,
+        },
     }
 }
 
@@ -76,21 +87,14 @@ MIDDLEWARE = [
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
-    # cache middleware
-    "django.middleware.cache.UpdateCacheMiddleware",
-    #
     "django.middleware.common.CommonMiddleware",
-    # cache middleware
-    "django.middleware.cache.FetchFromCacheMiddleware",
-    #
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    # middleware is executed in the given order during the request phase, and in reverse oder during the response phase. UpdateCacheMiddleware is placed before CommonMiddleware
-    # because it runs during response time, when middleware is executed in reverse order.
-    # FetchFromCacheMiddleware is placed after CommonMiddleware intentionally because it needs
-    # to access the request data set by the later.
+    # the site-wide cache middleware is not used: full responses were
+    # shared between users and went stale after edits; pages cache
+    # versioned fragments instead (see courses.cache)
 ]
 
 ROOT_URLCONF = "educa.urls"
@@ -170,14 +174,31 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# part files of chunked uploads, kept outside MEDIA_ROOT so they are never
+# served; see courses.uploads
+UPLOAD_ROOT = BASE_DIR / "uploads"
+
+# protected downloads of course files are sent by the web server with
+# "x-accel-redirect" (nginx, from an internal location serving MEDIA_ROOT
+# at MEDIA_ACCEL_REDIRECT_PREFIX) or "x-sendfile"; None streams them from
+# Django with Range support. The originals under files/ and images/ must
+# not be public, only the image variants are, e.g. with nginx:
+#
+#   location /media/ { alias <MEDIA_ROOT>/; }
+#   location /media/files/ { return 404; }
+#   location /media/images/ { return 404; }
+#   location /media/images/variants/ { alias <MEDIA_ROOT>/images/variants/; }
+#   location /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = "/protected-media/"
+
+# threads running the work done after a save (image variants, video
+# metadata), 0 to run it during the request
+BACKGROUND_WORKERS = 2
+
 LOGIN_REDIRECT_URL = reverse_lazy("student_course_list")
 
 # debug toolbar settings
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
-
-# cache setting
-CACHE_MIDDLEWARE_ALIAS = "default"
-CACHE_MIDDLEWARE_SECONDS = 60 * 15  # 15 minutes
-CACHE_MIDDLEWARE_KEY_PREFIX = "educa"
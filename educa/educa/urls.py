@@ -24,6 +24,8 @@ from django.urls import include, path
 # import for public course list
 from courses.views import CourseListView
 
+# import to serve the media without the File and Image originals
+from courses.downloads import serve_public_media
 
 urlpatterns = [
     path("accounts/login/", auth_views.LoginView.as_view(), name="login"),
@@ -38,4 +40,6 @@ urlpatterns = [
 
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += static(
+        settings.MEDIA_URL, serve_public_media, document_root=settings.MEDIA_ROOT
+    )
@@ -1,3 +1,110 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from courses.models import Content, Course, Module, Subject, Text
+from courses.testing import LOCMEM_CACHES
 
 # Create your tests here.
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StudentCourseDetailViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.student = User.objects.create_user(username="student")
+        subject = Subject.objects.create(title="Mathematics", slug="mathematics")
+        self.course = Course.objects.create(
+            owner=self.student,
+            subject=subject,
+            title="Algebra",
+            slug="algebra",
+            overview="Overview",
+        )
+        self.course.students.add(self.student)
+        self.client.force_login(self.student)
+
+    def add_module(self, contents):
+        module = Module.objects.create(course=self.course, title="Module")
+        for n in range(contents):
+            text = Text.objects.create(
+                owner=self.student, title=f"Text {n}", content="Content"
+            )
+            Content.objects.create(module=module, item=text)
+        return module
+
+    def assertDetailQueries(self, url, num):
+        # always measure with cold caches
+        cache.clear()
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_is_constant(self):
+        url = reverse("student_course_detail", args=[self.course.id])
+        self.add_module(contents=1)
+        self.assertDetailQueries(url, 7)
+        for _ in range(5):
+            self.add_module(contents=10)
+        self.assertDetailQueries(url, 7)
+
+    def test_selected_module(self):
+        self.add_module(contents=1)
+        module = self.add_module(contents=3)
+        url = reverse("student_course_detail_module", args=[self.course.id, module.id])
+        response = self.assertDetailQueries(url, 7)
+        self.assertEqual(response.context["module"]["id"], module.id)
+        self.assertContains(response, "Text 2")
+
+    def test_cached_fragments(self):
+        module = self.add_module(contents=3)
+        url = reverse("student_course_detail", args=[self.course.id])
+        self.client.get(url)
+        # session, user and course; modules and contents come from the cache
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertContains(response, "Text 2")
+        text = Text.objects.create(owner=self.student, title="New text", content="")
+        Content.objects.create(module=module, item=text)
+        self.assertContains(self.client.get(url), "New text")
+
+    def test_contents_version(self):
+        module = self.add_module(contents=2)
+        other = self.add_module(contents=1)
+        module.refresh_from_db()
+        version = module.contents_version
+        # enrollments and other modules leave the contents untouched
+        self.course.students.add(User.objects.create_user(username="other"))
+        Text.objects.create(owner=self.student, title="Unused", content="")
+        Content.objects.create(
+            module=other, item=Text.objects.create(owner=self.student, title="X")
+        )
+        module.refresh_from_db()
+        self.assertEqual(module.contents_version, version)
+        text = module.contents.first().item
+        text.title = "Renamed"
+        text.save()
+        module.refresh_from_db()
+        self.assertEqual(module.contents_version, version + 1)
+        url = reverse("student_course_detail", args=[self.course.id])
+        self.assertContains(self.client.get(url), "Renamed")
+
+    def test_other_student(self):
+        self.add_module(contents=1)
+        url = reverse("student_course_detail", args=[self.course.id])
+        self.client.get(url)
+        self.client.force_login(User.objects.create_user(username="other"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_unknown_module(self):
+        url = reverse("student_course_detail_module", args=[self.course.id, 0])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_empty_course(self):
+        url = reverse("student_course_detail", args=[self.course.id])
+        response = self.assertDetailQueries(url, 5)
+        self.assertIsNone(response.context["module"])
+        self.assertContains(response, "No modules yet.")
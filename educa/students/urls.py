@@ -1,10 +1,6 @@
 from django.urls import path
 from . import views
 
-# import for cache the output of individual views
-from django.views.decorators.cache import cache_page
-
-
 urlpatterns = [
     path(
         "register/",
@@ -19,12 +15,12 @@ urlpatterns = [
     path("courses/", views.StudentCourseListView.as_view(), name="student_course_list"),
     path(
         "course/<pk>/",
-        cache_page(60 * 15)(views.StudentCourseDetailView.as_view()),
+        views.StudentCourseDetailView.as_view(),
         name="student_course_detail",
     ),
     path(
         "course/<pk>/<module_id>/",
-        cache_page(60 * 15)(views.StudentCourseDetailView.as_view()),
+        views.StudentCourseDetailView.as_view(),
         name="student_course_detail_module",
     ),
 ]
@@ -14,8 +14,11 @@ from .forms import CourseEnrollForm
 # imports for displaying all courses enrolled by the students
 from django.views.generic.list import ListView
 from courses.models import Course
+from courses.catalog import get_course_modules, get_module_contents
+from courses.enrollment import get_enrolled_course_ids, is_enrolled
 
 # imports for showing details of each course
+from django.http import Http404
 from django.views.generic.detail import DetailView
 
 
@@ -55,7 +58,7 @@ class StudentCourseListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         qs = super().get_queryset()
-        return qs.filter(students__in=[self.request.user])
+        return qs.filter(id__in=get_enrolled_course_ids(self.request.user))
 
 
 # view to display details of a course
@@ -65,16 +68,28 @@ class StudentCourseDetailView(LoginRequiredMixin, DetailView):
 
     def get_queryset(self):
         qs = super().get_queryset()
-        return qs.filter(students__in=[self.request.user])
+        if not is_enrolled(self.request.user, self.kwargs["pk"]):
+            return qs.none()
+        return qs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # get course object
-        course = self.get_object()
+        # module navigation, cached per course version
+        modules = get_course_modules(self.object)
+        module = None
         if "module_id" in self.kwargs:
             # get current module
-            context["module"] = course.modules.get(id=self.kwargs["module_id"])
-        else:
+            module_id = str(self.kwargs["module_id"])
+            module = next((m for m in modules if str(m["id"]) == module_id), None)
+            if module is None:
+                raise Http404("No module found matching the query")
+        elif modules:
             # get first module
-            context["module"] = course.modules.all()[0]
+            module = modules[0]
+        context.update({"modules": modules, "module": module})
+        if module is not None:
+            # rendered contents, cached per module contents version
+            context["contents"] = get_module_contents(
+                module["id"], module["contents_version"]
+            )
         return context